@@ -161,6 +161,66 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 60 * 60 * 12
 
+# Cache shared by every process, e.g. for invalidating per-process caches
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", CELERY_BROKER_URL),
+    }
+}
+
+EB_SEARCH_CACHE_SIZE = int(os.getenv("EB_SEARCH_CACHE_SIZE", 64))  # Search results kept in each web process
+EB_SEARCH_CACHE_TIMEOUT = int(os.getenv("EB_SEARCH_CACHE_TIMEOUT", 60 * 60))  # Seconds search results are kept in Redis
+
+# Machine Learning Options
+EB_ML_WARM_UP = os.getenv("EB_ML_WARM_UP", "True") == "True"
+EB_ML_PRELOAD_MODELS = os.getenv("EB_ML_PRELOAD_MODELS", "True") == "True"  # Load once, before forking the pool
+EB_ML_IMAGE_CACHE_BYTES = int(os.getenv("EB_ML_IMAGE_CACHE_BYTES", 512 * 1024**2))  # Decoded pixels kept per task
+EB_ML_LOADER_WORKERS = int(os.getenv("EB_ML_LOADER_WORKERS", 4))  # Threads decoding photos ahead of inference
+EB_ML_LOADER_DEPTH = int(os.getenv("EB_ML_LOADER_DEPTH", 32))  # Maximum number of photos/crops loaded ahead
+EB_ML_MEMORY_FRACTION = float(os.getenv("EB_ML_MEMORY_FRACTION", 0.5))  # Share of available memory a batch may use
+EB_ML_DETECT_BATCH_SIZE = int(os.getenv("EB_ML_DETECT_BATCH_SIZE", 16))  # Upper bound, shrunk to fit memory
+EB_ML_DETECT_BYTES_PER_IMAGE = int(os.getenv("EB_ML_DETECT_BYTES_PER_IMAGE", 128 * 1024**2))
+EB_ML_EXTRACT_BATCH_SIZE = int(os.getenv("EB_ML_EXTRACT_BATCH_SIZE", 64))
+EB_ML_EXTRACT_BYTES_PER_CROP = int(os.getenv("EB_ML_EXTRACT_BYTES_PER_CROP", 48 * 1024**2))
+EB_ML_EAR_CASCADE = os.getenv("EB_ML_EAR_CASCADE", "False") == "True"  # Only search for ears around elephants
+EB_ML_EAR_CASCADE_MIN_CONF = float(os.getenv("EB_ML_EAR_CASCADE_MIN_CONF", 0.25))  # Weaker elephants are ignored
+EB_ML_EAR_CASCADE_PADDING = float(os.getenv("EB_ML_EAR_CASCADE_PADDING", 0.1))  # Per side, relative to elephant size
+EB_ML_OPTIMIZED_EMBEDDER = os.getenv("EB_ML_OPTIMIZED_EMBEDDER", "False") == "True"  # int8/channels-last ear embedder
+EB_ML_TORCH_THREADS = int(os.getenv("EB_ML_TORCH_THREADS", 0))  # Intra-op threads per worker process, 0 for default
+EB_ML_INFERENCE_SOCKET = os.getenv("EB_ML_INFERENCE_SOCKET", "")  # Inference executor socket, empty to run in-process
+EB_ML_INFERENCE_MAX_BATCH = int(os.getenv("EB_ML_INFERENCE_MAX_BATCH", 32))  # Largest batch the executor runs at once
+EB_ML_INFERENCE_MAX_LATENCY = float(os.getenv("EB_ML_INFERENCE_MAX_LATENCY", 0.05))  # Seconds waiting for others
+EB_ML_INFERENCE_TIMEOUT = float(os.getenv("EB_ML_INFERENCE_TIMEOUT", 120))  # Seconds before giving up on the executor
+EB_ML_ARTIFACT_DIR = os.getenv("EB_ML_ARTIFACT_DIR", os.path.join(BASE_DIR, "eb_ml", "data", "artifacts"))
+EB_ML_OFFLINE = os.getenv("EB_ML_OFFLINE", "False") == "True"  # Never fall back to `torch.hub` for missing artifacts
+EB_ML_INDEX_DIR = os.getenv("EB_ML_INDEX_DIR", os.path.join(BASE_DIR, "eb_ml", "data", "index"))  # Shared snapshots
+EB_ML_INDEX_REFRESH_INTERVAL = float(os.getenv("EB_ML_INDEX_REFRESH_INTERVAL", 60))  # Seconds between snapshots
+EB_ML_SUGGESTIONS = int(os.getenv("EB_ML_SUGGESTIONS", 5))  # Candidate individuals shown on a sighting
+EB_ML_IDENTIFY_MIN_CONF = float(os.getenv("EB_ML_IDENTIFY_MIN_CONF", 0.25))  # Ear detections used to identify a photo
+EB_ML_IDENTIFY_WARM_UP = os.getenv("EB_ML_IDENTIFY_WARM_UP", "False") == "True"  # Load models in web workers
+EB_ML_RESCORE_INTERVAL = float(os.getenv("EB_ML_RESCORE_INTERVAL", 60))  # Seconds between incremental rescorings
+EB_ML_RESCORE_LOCK_TIMEOUT = int(os.getenv("EB_ML_RESCORE_LOCK_TIMEOUT", 60 * 60))  # Seconds a stuck run blocks
+EB_ML_DUPLICATES_PER_INDIVIDUAL = int(os.getenv("EB_ML_DUPLICATES_PER_INDIVIDUAL", 5))  # Candidates per individual
+EB_ML_DUPLICATES_BLOCK_SIZE = int(os.getenv("EB_ML_DUPLICATES_BLOCK_SIZE", 1024))  # Score matrix rows/columns at a time
+EB_ML_DUPLICATES_MIN_SCORE = float(os.getenv("EB_ML_DUPLICATES_MIN_SCORE", 0.8))  # Weaker pairs are not reviewed
+EB_ML_DUPLICATES_INTERVAL = float(os.getenv("EB_ML_DUPLICATES_INTERVAL", 60 * 60 * 24))  # Seconds between searches
+
+CELERY_BEAT_SCHEDULE = {
+    "update-changed-scorings": {
+        "task": "eb_ml.tasks.update_changed_scorings",
+        "schedule": EB_ML_RESCORE_INTERVAL,
+    },
+    "refresh-embedding-indexes": {
+        "task": "eb_ml.tasks.refresh_embedding_indexes",
+        "schedule": EB_ML_INDEX_REFRESH_INTERVAL,
+    },
+    "find-duplicate-individuals": {
+        "task": "eb_ml.tasks.find_duplicate_individuals",
+        "schedule": EB_ML_DUPLICATES_INTERVAL,
+    },
+}
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
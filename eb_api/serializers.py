@@ -6,6 +6,7 @@ from eb_core.models import (
     Individual_Sighting,
     Seek_Identity,
 )
+from eb_ml.models import Ear_Bbox
 
 
 class EarthRangerSightingSerializer(serializers.ModelSerializer):
@@ -46,3 +47,9 @@ class IndividualSerializer(serializers.ModelSerializer):
 
         if not self.context.get("include_latest_seek_identity", False):
             self.fields.pop("latest_seek_identity")
+
+
+class IdentifySerializer(serializers.Serializer):
+    image = serializers.ImageField()
+    k = serializers.IntegerField(default=10, min_value=1, max_value=100)
+    ear = serializers.ChoiceField(choices=list(Ear_Bbox.cls_map.values()), required=False)
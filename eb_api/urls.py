@@ -7,4 +7,5 @@ urlpatterns = [
     path("individual_sighting/", views.IndividualSightingView.as_view()),
     path("individual/", views.IndividualView.as_view()),
     path("seek_identity/", views.SeekIdentityView.as_view()),
+    path("identify/", views.IdentifyView.as_view()),
 ]
@@ -1,7 +1,11 @@
 import json
 
-from django.db.models import OuterRef, Subquery
+from django.db.models import F
+from PIL import Image
 from rest_framework import generics
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from eb_core.models import (
     EarthRanger_Sighting,
@@ -9,9 +13,12 @@ from eb_core.models import (
     Individual_Sighting,
     Seek_Identity,
 )
+from eb_ml.identify import identify
+from eb_ml.models import Ear_Bbox
 
 from .serializers import (
     EarthRangerSightingSerializer,
+    IdentifySerializer,
     IndividualSerializer,
     IndividualSightingSerializer,
     SeekIdentitySerializer,
@@ -286,15 +293,7 @@ class IndividualView(generics.ListAPIView):
 
         include_latest_seek_identity = _is_truthy(query_params.get("include_latest_seek_identity"))
         if include_latest_seek_identity:
-            queryset = queryset.annotate(
-                latest_seek_identity=Subquery(
-                    Individual_Sighting.objects.filter(
-                        individual_id=OuterRef("id"),
-                    )
-                    .order_by("-pk")
-                    .values("seek_identity")[:1]
-                )
-            )
+            queryset = queryset.annotate(latest_seek_identity=F("summary__latest_seek_identity"))
 
         filters = query_params.getlist("filter")
         if filters:
@@ -362,3 +361,46 @@ class SeekIdentityView(generics.ListAPIView):
             queryset = queryset.filter(**{k: v for filter in filters for k, v in json.loads(filter).items()})
 
         return queryset
+
+
+class IdentifyView(APIView):
+    """
+    Candidate individuals for a photo, without uploading it to a sighting.
+
+    Parameters
+    ----------
+    image : file
+        Photo of an elephant, or crop of one of its ears
+    k : int, default 10
+        Number of candidates
+    ear : right/left
+        Side of the ear if `image` is an ear crop, skipping ear detection
+    """
+
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        serializer = IdentifySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        result = identify(
+            Image.open(serializer.validated_data["image"]),
+            k=serializer.validated_data["k"],
+            ear=serializer.validated_data.get("ear"),
+        )
+
+        individuals = Individual.objects.in_bulk([individual_id for individual_id, _ in result["candidates"]])
+        return Response(
+            {
+                "candidates": [
+                    {"individual": individual_id, "name": individuals[individual_id].name, "score": score}
+                    for individual_id, score in result["candidates"]
+                    if individual_id in individuals
+                ],
+                "ears": [
+                    {"ear": Ear_Bbox.cls_map[bbox.cls], "conf": bbox.conf, "bbox": [bbox.x1, bbox.y1, bbox.x2, bbox.y2]}
+                    for bbox in result["ears"]
+                ],
+                "timings": result["timings"],
+            }
+        )
@@ -4,6 +4,7 @@ import django.db.models.fields
 import numpy as np
 import pandas as pd
 from django.contrib import admin
+from django.db.models import Prefetch
 from django.http import HttpResponse
 
 from .models import (
@@ -14,6 +15,7 @@ from .models import (
     Individual_Bounding_Box,
     Individual_Photo,
     Individual_Sighting,
+    Individual_Summary,
     Injury,
     Seek_Identity,
     Sighting_Bounding_Box,
@@ -62,7 +64,18 @@ class Individual_Admin(admin.ModelAdmin):
         return response
 
     def export(self, request, queryset):
-        queryset = queryset.order_by("pk")
+        queryset = (
+            queryset.order_by("pk")
+            .select_related("summary__latest_seek_identity")
+            .prefetch_related(
+                Prefetch(
+                    "individual_sighting_set",
+                    queryset=Individual_Sighting.objects.select_related("group_sighting").order_by(
+                        "group_sighting__datetime"
+                    ),
+                )
+            )
+        )
         seek_fields = [
             field for field in Seek_Identity._meta.get_fields() if type(field) == django.db.models.fields.CharField
         ]
@@ -71,14 +84,14 @@ class Individual_Admin(admin.ModelAdmin):
         for individual in queryset:
             entry = {
                 "name": individual.name,
-                "num_sightings": individual.individual_sighting_set.count(),
+                "num_sightings": individual.summary.num_sightings,
             }
             entry["sighting_times"] = [
                 str(individual_sighting.group_sighting.datetime)
-                for individual_sighting in individual.individual_sighting_set.order_by("group_sighting__datetime")
+                for individual_sighting in individual.individual_sighting_set.all()
             ]
             if entry["num_sightings"]:
-                seek_code = individual.individual_sighting_set.latest().seek_identity
+                seek_code = individual.summary.latest_seek_identity
                 entry.update({field.name: getattr(seek_code, field.name) for field in seek_fields})
             data.append(entry)
         df = pd.DataFrame(data)
@@ -100,6 +113,7 @@ admin.site.register(Group_Sighting)
 admin.site.register(EarthRanger_Sighting)
 admin.site.register(Subgroup_Sighting)
 admin.site.register(Individual, Individual_Admin)
+admin.site.register(Individual_Summary)
 admin.site.register(Seek_Identity, Seek_Identity_Admin)
 
 admin.site.register(Sighting_Photo)
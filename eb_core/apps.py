@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class EbCoreConfig(AppConfig):
     name = "eb_core"
+
+    def ready(self):
+        from . import seek, summaries  # noqa: F401
@@ -0,0 +1,39 @@
+"""Version number of everything a search result depends on.
+
+SEEK codes, identities, sighting dates and regions, embedding centroids and stored scores all bump a single counter in
+the Django cache when they change, so cached search results only need to carry the version they were computed at.
+Saved group sightings bump it from the receiver in `eb_core.summaries`.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "eb_core.catalogue.version"
+
+
+def _initialize():
+    # Start from the clock so a counter lost from the cache never reissues a version that results were cached at
+    cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+
+
+def version():
+    """Current catalogue version, shared by every process."""
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        _initialize()
+        current = cache.get(VERSION_KEY)
+    return current
+
+
+def bump():
+    """Move to a new catalogue version once the current transaction commits."""
+
+    def incr():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            _initialize()
+            cache.incr(VERSION_KEY)
+
+    transaction.on_commit(incr)
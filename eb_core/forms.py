@@ -167,6 +167,11 @@ class Search_Form(forms.ModelForm):
     )  # .filter(scoring__isnull=False)
     binary = forms.BooleanField(required=False)
     region = forms.ChoiceField(choices=region_choices, required=False)
+    match_gender_age = forms.BooleanField(
+        required=False, help_text="Only individuals whose gender and age match, allowing unknowns"
+    )
+    seen_after = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}))
+    seen_before = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}))
 
     class Meta:
         model = Seek_Identity
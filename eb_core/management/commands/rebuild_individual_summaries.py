@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from eb_core import summaries
+from eb_core.models import Individual, Individual_Summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the `Individual_Summary` of individuals without one, "
+        "or recompute every summary from the stored sightings with --all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Recompute every summary")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            summaries.refresh()
+            self.stdout.write(f"Rebuilt {Individual_Summary.objects.count()} individual summaries")
+            return
+
+        individual_ids = list(Individual.objects.filter(summary__isnull=True).values_list("pk", flat=True))
+        summaries.refresh(individual_ids)
+        self.stdout.write(f"Built {len(individual_ids)} missing individual summaries")
@@ -14,6 +14,10 @@ def NON_POLYMORPHIC_CASCADE(collector, field, sub_objs, using):
     return models.CASCADE(collector, field, sub_objs.non_polymorphic(), using)
 
 
+# Newest `Individual_Sighting` first: the one `latest()` returns, whose SEEK code is its individual's latest
+LATEST_SIGHTING_ORDERING = ["-group_sighting", "-pk"]
+
+
 class EB_Core_Permisson(models.Model):
     class Meta:
         managed = False
@@ -63,9 +67,48 @@ class EarthRanger_Sighting(Group_Sighting):
         return f"{self.pk} - {self.earthranger_serial}"
 
 
-class Individual_Sighting(models.Model):
+class TrackedFieldsMixin:
+    """Remembers the values `tracked_fields` had in the database, so `post_save` receivers can tell what changed.
+
+    `previous` holds the values loaded from the database until every `post_save` receiver of a save has run, and those
+    saved afterwards. Unsaved instances have none.
+    """
+
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked_fields()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_tracked_fields()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_tracked_fields()
+
+    def _remember_tracked_fields(self):
+        # Read from `__dict__` so deferred fields don't trigger a query
+        self._tracked_values = {field: self.__dict__.get(field) for field in self.tracked_fields}
+
+    def previous(self, field):
+        """Value of the tracked `field` in the database, `None` if unknown."""
+        return getattr(self, "_tracked_values", {}).get(field)
+
+    def has_changed(self, *fields):
+        """Whether any of the tracked `fields` differs from its value in the database."""
+        return any(self.previous(field) != getattr(self, field) for field in fields)
+
+
+class Individual_Sighting(TrackedFieldsMixin, models.Model):
     """Model representing a single elephant spotted at a single time and place."""
 
+    # Read by the receivers that keep SEEK matrices, summaries, scores and centroids current
+    tracked_fields = ("individual_id", "group_sighting_id", "seek_identity_id")
+
     individual = models.ForeignKey("Individual", null=True, blank=True, on_delete=models.PROTECT)
     group_sighting = models.ForeignKey("Group_Sighting", on_delete=models.CASCADE)
 
@@ -102,7 +145,7 @@ class Individual_Sighting(models.Model):
     )
 
     class Meta:
-        get_latest_by = "group_sighting"
+        get_latest_by = ["group_sighting", "pk"]
 
     def __str__(self):
         return f"{self.pk}"
@@ -184,6 +227,28 @@ class Individual(models.Model):
         return f"{self.pk} - {self.name}"
 
 
+class Individual_Summary(models.Model):
+    """Model holding denormalized facts about an `Individual` that would otherwise need a subquery per individual.
+
+    The latest SEEK code is that of the `Individual_Sighting` returned by `latest()`, the last position that of the
+    most recent `Group_Sighting`. Kept current by `eb_core.summaries`.
+    """
+
+    individual = models.OneToOneField("Individual", primary_key=True, related_name="summary", on_delete=models.CASCADE)
+
+    latest_seek_identity = models.ForeignKey(
+        "Seek_Identity", related_name="+", null=True, blank=True, on_delete=models.SET_NULL
+    )
+    num_sightings = models.PositiveIntegerField(default=0)
+    first_seen = models.DateTimeField(null=True, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_lat = models.FloatField(null=True, blank=True)
+    last_lon = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.individual_id}"
+
+
 class Photo(PolymorphicModel):
     """Model representing a photo taken in the field."""
 
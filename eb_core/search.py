@@ -0,0 +1,301 @@
+"""Planning and execution of `Search_View` searches.
+
+Filters run cheapest first so that each one only has to look at the candidates the previous ones left: SEEK bitmap
+lookups in memory, then indexed queries over sighting dates, then region lookups inside the EarthRanger JSON. Only the
+surviving individuals are scored, and ear embedding scores are only computed for those that still have a SEEK score.
+
+Results are cached under their normalized parameters and the `eb_core.catalogue` version, in a bounded in-process LRU in
+front of the Django cache, so repeating a search costs a version lookup until anything it depends on changes.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from eb_ml.models import Score
+from eb_ml.tasks import (
+    EMB_SCORE_CLASSES,
+    SCORE_WEIGHTS,
+    get_centroid_emb_scores,
+)
+
+from . import catalogue
+from .models import Individual, Individual_Sighting
+from .seek import WILDCARD, format_code, get_seek_matrix, score_codes
+
+logger = logging.getLogger(__name__)
+
+# Above this many candidates a query filter fetches every match and intersects in memory rather than sending the
+# candidates along as `pk__in`
+IN_QUERY_LIMIT = 1000
+
+# Relative cost of each kind of filter, cheapest first
+BITMAP_COST = 1
+INDEXED_QUERY_COST = 2
+JSON_QUERY_COST = 3
+
+RESULTS_KEY = "eb_core.search.results.{}.{}"  # Catalogue version, digest of the normalized parameters
+
+
+class SearchPlanner:
+    """Runs filters over candidate individual ids in order of increasing cost and records what each stage did."""
+
+    def __init__(self):
+        self.filters = []
+        self.stages = []
+
+    def add_filter(self, name, cost, function):
+        """Register `function`, which returns the subset of a sorted int64 array of candidate ids that it keeps."""
+        self.filters.append((cost, len(self.filters), name, function))
+
+    def add_query_filter(self, name, cost, queryset):
+        """Register a filter keeping the candidates that are in `queryset`, a queryset of `Individual` objects."""
+
+        def apply(individual_ids):
+            matches = queryset
+            if len(individual_ids) <= IN_QUERY_LIMIT:
+                matches = matches.filter(pk__in=individual_ids.tolist())
+            matching_ids = np.fromiter(matches.values_list("pk", flat=True).distinct(), dtype=np.int64)
+            return individual_ids[np.isin(individual_ids, matching_ids)]
+
+        self.add_filter(name, cost, apply)
+
+    def record(self, name, candidates, start):
+        self.stages.append({"stage": name, "candidates": candidates, "ms": 1000 * (time.perf_counter() - start)})
+
+    def run(self, individual_ids):
+        for _, _, name, function in sorted(self.filters, key=lambda entry: entry[:2]):
+            if not len(individual_ids):
+                break
+            start = time.perf_counter()
+            individual_ids = function(individual_ids)
+            self.record(name, len(individual_ids), start)
+        return individual_ids
+
+
+class SearchResults:
+    """Scored candidates of a search, aligned arrays sorted by individual id."""
+
+    def __init__(self, individual_ids, seek_codes, scores, columns, stages):
+        self.individual_ids = individual_ids
+        self.seek_codes = seek_codes
+        self.scores = scores
+        self.columns = columns
+        self.stages = stages
+
+
+def _day_start(date):
+    return timezone.make_aware(datetime.combine(date, datetime.min.time()))
+
+
+def _emb_scores(individual_sighting_id, individual_ids, emb_columns):
+    """Ear embedding scores of `individual_sighting_id` against `individual_ids`, per column in `emb_columns`.
+
+    Stored `Score` rows are used if the sighting has any, otherwise they are computed from the centroids. A sighting
+    whose `Scoring` was written before scores moved to `Score` rows has none until it is rescored.
+    """
+    columns = {column: np.full(len(individual_ids), np.nan) for column in emb_columns}
+    positions = {pk: i for i, pk in enumerate(individual_ids.tolist())}
+
+    scores = Score.objects.filter(individual_sighting_id=individual_sighting_id)
+    if scores.exists():
+        if len(individual_ids) <= IN_QUERY_LIMIT:
+            scores = scores.filter(individual__in=list(positions))
+        for individual_id, *values in scores.values_list("individual", *emb_columns):
+            if individual_id in positions:
+                for column, value in zip(emb_columns, values):
+                    columns[column][positions[individual_id]] = np.nan if value is None else value
+        return columns
+
+    database_individuals = Individual.objects.filter(pk__in=list(positions)).order_by("pk")
+    rows = [positions[pk] for pk in database_individuals.values_list("pk", flat=True)]
+    for column in emb_columns:
+        columns[column][rows] = get_centroid_emb_scores(
+            Individual_Sighting.objects.filter(pk=individual_sighting_id),
+            EMB_SCORE_CLASSES[column],
+            database_individuals,
+        )[0]
+    return columns
+
+
+def execute(
+    seek_code,
+    individual_sighting_id=None,
+    binary=False,
+    region=None,
+    match_gender_age=False,
+    seen_after=None,
+    seen_before=None,
+):
+    """Filter and score the individuals that have a SEEK code, bypassing the cache.
+
+    Parameters
+    ----------
+    seek_code: numpy.ndarray
+        Encoded query code, see `eb_core.seek.encode`.
+    individual_sighting_id: int or None
+        Sighting whose ear embedding scores are combined with the SEEK score.
+    binary: bool
+        Only keep individuals whose code matches `seek_code` up to wildcards.
+    region: str or None
+        Only keep individuals sighted in this EarthRanger region.
+    match_gender_age: bool
+        Only keep individuals whose gender and age class match `seek_code` up to wildcards.
+    seen_after, seen_before: datetime.date or None
+        Only keep individuals sighted within this inclusive date range.
+
+    Returns
+    -------
+    SearchResults
+        Candidates with a score, and the stages that produced them.
+    """
+    planner = SearchPlanner()
+
+    start = time.perf_counter()
+    seek_matrix = get_seek_matrix()
+    individual_ids, _ = seek_matrix.select()
+    planner.record("SEEK codes", len(individual_ids), start)
+
+    if binary:
+        planner.add_filter("binary SEEK", BITMAP_COST, lambda ids: seek_matrix.candidates(seek_code, ids)[0])
+
+    if match_gender_age:
+        gender_age_code = np.full_like(seek_code, WILDCARD)
+        gender_age_code[:2] = seek_code[:2]
+        planner.add_filter("gender/age", BITMAP_COST, lambda ids: seek_matrix.candidates(gender_age_code, ids)[0])
+
+    if seen_after or seen_before:
+        sightings = {}
+        if seen_after:
+            sightings["individual_sighting__group_sighting__datetime__gte"] = _day_start(seen_after)
+        if seen_before:
+            sightings["individual_sighting__group_sighting__datetime__lt"] = _day_start(seen_before + timedelta(days=1))
+        planner.add_query_filter("date range", INDEXED_QUERY_COST, Individual.objects.filter(**sightings))
+
+    if region:
+        planner.add_query_filter(
+            "region",
+            JSON_QUERY_COST,
+            Individual.objects.filter(individual_sighting__group_sighting__json__event_details__RegionName=region),
+        )
+
+    individual_ids = planner.run(individual_ids)
+
+    start = time.perf_counter()
+    _, seek_codes = seek_matrix.select(individual_ids)
+    seek_scores = score_codes(seek_code[None], seek_codes)[0]
+    columns = {"seek_score": seek_scores}
+    scores = seek_scores
+    planner.record("SEEK scoring", len(individual_ids), start)
+
+    if individual_sighting_id is not None and len(individual_ids):
+        start = time.perf_counter()
+        emb_columns = [column for column in SCORE_WEIGHTS if column in EMB_SCORE_CLASSES]
+        columns |= _emb_scores(individual_sighting_id, individual_ids, emb_columns)
+
+        component_scores = np.array([columns[column] for column in SCORE_WEIGHTS])
+        scores = np.ma.average(
+            np.ma.MaskedArray(component_scores, mask=np.isnan(component_scores)),
+            weights=list(SCORE_WEIGHTS.values()),
+            axis=0,
+        ).filled(np.nan)
+        planner.record("ear embedding scoring", len(individual_ids), start)
+
+    keep = ~np.isnan(scores)
+    results = SearchResults(
+        individual_ids[keep],
+        seek_codes[keep],
+        scores[keep],
+        {column: values[keep] for column, values in columns.items()},
+        planner.stages,
+    )
+    logger.debug(
+        "Search plan: %s",
+        ", ".join(f"{stage['stage']} {stage['candidates']} ({stage['ms']:.1f}ms)" for stage in planner.stages),
+    )
+    return results
+
+
+class ResultCache:
+    """Bounded in-process LRU of `SearchResults` in front of the shared Django cache."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, results):
+        with self._lock:
+            self._entries[key] = results
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        results = cache.get(key)
+        if results is not None:
+            self._remember(key, results)
+        return results
+
+    def set(self, key, results):
+        cache.set(key, results, timeout=self.timeout)
+        self._remember(key, results)
+
+
+_result_cache = ResultCache(settings.EB_SEARCH_CACHE_SIZE, settings.EB_SEARCH_CACHE_TIMEOUT)
+
+
+def normalize(
+    seek_code,
+    individual_sighting_id=None,
+    binary=False,
+    region=None,
+    match_gender_age=False,
+    seen_after=None,
+    seen_before=None,
+):
+    """Canonical form of the parameters of `search`, equal for searches that are bound to give the same results."""
+    return {
+        "seek_code": format_code(seek_code),
+        "individual_sighting_id": None if individual_sighting_id is None else int(individual_sighting_id),
+        "binary": bool(binary),
+        "region": region or None,
+        "match_gender_age": bool(match_gender_age),
+        "seen_after": seen_after.isoformat() if seen_after else None,
+        "seen_before": seen_before.isoformat() if seen_before else None,
+    }
+
+
+def search(seek_code, **kwargs):
+    """Cached `execute`, taking the same parameters.
+
+    On a cache hit the returned stages only contain the lookup itself.
+    """
+    start = time.perf_counter()
+    params = normalize(seek_code, **kwargs)
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    key = RESULTS_KEY.format(catalogue.version(), digest)
+
+    results = _result_cache.get(key)
+    if results is None:
+        results = execute(seek_code, **kwargs)
+        _result_cache.set(key, results)
+        return results
+
+    stages = [{"stage": "cached results", "candidates": len(results.individual_ids), "ms": 0.0}]
+    results = SearchResults(results.individual_ids, results.seek_codes, results.scores, results.columns, stages)
+    stages[0]["ms"] = 1000 * (time.perf_counter() - start)
+    return results
@@ -0,0 +1,372 @@
+"""Integer-encoded SEEK codes and a process-level cache of the latest code of every `Individual`.
+
+Codes are stored as one uint8 per position (the ASCII value of its character, so the wildcard "?" is a code of its
+own), which turns scoring into integer comparisons over a single matrix. Whenever a `Seek_Identity` or
+`Individual_Sighting` changes, the affected individuals are recorded under a new version in the Django cache so every
+process can update just those rows of its cached matrix and bitmap index.
+"""
+import threading
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalogue
+from .models import Individual, Individual_Sighting, Seek_Identity
+
+# Fields of `Seek_Identity` in `__array__` order
+SEEK_FIELDS = [
+    "gender",
+    "age",
+    "r_tusk",
+    "l_tusk",
+    "r_prom_tear",
+    "r_prom_hole",
+    "r_sec_tear",
+    "r_sec_hole",
+    "l_prom_tear",
+    "l_prom_hole",
+    "l_sec_tear",
+    "l_sec_hole",
+    "r_extreme",
+    "l_extreme",
+    "r_special",
+    "l_special",
+    "body_special",
+]
+
+WILDCARD = ord("?")
+
+# Separators `Seek_Identity.__str__` inserts before these positions
+SEPARATORS = {2: "T", 4: "E", 8: "-", 12: "X", 14: "S"}
+
+VERSION_KEY = "eb_core.seek.version"
+CHANGES_KEY = "eb_core.seek.changes.{}"  # Individuals whose code changed in a version
+CHANGES_TIMEOUT = 60 * 60 * 24
+
+
+def encode(codes):
+    """uint8 matrix with one row per code in `codes`.
+
+    Parameters
+    ----------
+    codes: iterable
+        `Seek_Identity` objects, 17 character strings, arrays as returned by `np.array(seek_identity)` or already
+        encoded rows. An already encoded matrix is returned as is.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape `(len(codes), len(SEEK_FIELDS))`.
+    """
+    if isinstance(codes, np.ndarray) and codes.dtype == np.uint8:
+        return codes
+
+    rows = []
+    for code in codes:
+        if isinstance(code, str):
+            rows.append(np.frombuffer(code.encode("ascii"), dtype=np.uint8))
+        elif isinstance(code, np.ndarray) and code.dtype == np.uint8:
+            rows.append(code)
+        else:
+            rows.append(np.asarray(code).astype("S1").view(np.uint8))
+    if not rows:
+        return np.empty((0, len(SEEK_FIELDS)), dtype=np.uint8)
+    return np.vstack(rows)
+
+
+def encode_values(values):
+    """uint8 row for a tuple of `SEEK_FIELDS` values as returned by `values_list`, mapping `None` to the wildcard."""
+    return np.array([WILDCARD if value is None else ord(value) for value in values], dtype=np.uint8)
+
+
+def format_code(row):
+    """Human readable code for an encoded row, matching `Seek_Identity.__str__`."""
+    return "".join(f"{SEPARATORS.get(i, '')}{chr(c)}" for i, c in enumerate(row))
+
+
+def _score(out_codes, database_codes, binary):
+    """Scores of `out_codes` against `database_codes`, broadcast together over every axis but the last."""
+    database_wildcards = database_codes == WILDCARD
+
+    matches = out_codes == database_codes
+    scores = matches.mean(axis=-1) - 0.4 * database_wildcards.mean(axis=-1)
+
+    # Exclude matches that differ from the given `SEEK_Identity` but don't exclude differences caused by wildcard.
+    if binary:
+        scores[~np.all(matches | database_wildcards | (out_codes == WILDCARD), axis=-1)] = np.nan
+
+    return scores
+
+
+def score_codes(out_codes, database_codes, binary=False):
+    """Score every code in `out_codes` against every code in `database_codes`.
+
+    Parameters
+    ----------
+    out_codes: numpy.ndarray
+        Encoded query codes of shape `(queries, positions)`.
+    database_codes: numpy.ndarray
+        Encoded database codes of shape `(individuals, positions)`.
+    binary: bool
+        Score differences that aren't explained by a wildcard as NaN.
+
+    Returns
+    -------
+    numpy.ndarray
+        Scores of shape `(queries, individuals)`.
+    """
+    return _score(out_codes[:, None, :], database_codes[None, :, :], binary)
+
+
+def score_code_pairs(out_codes, database_codes, binary=False):
+    """Score each code in `out_codes` against the code in the same row of `database_codes`, as `score_codes`.
+
+    Returns
+    -------
+    numpy.ndarray
+        Scores of shape `(pairs,)`.
+    """
+    return _score(out_codes, database_codes, binary)
+
+
+class SeekBitmapIndex:
+    """One bitset per (SEEK position, value) over the slots of a `SeekMatrix`.
+
+    The wildcard bitset of a position is the one for `WILDCARD`. Bitsets are packed eight slots per byte, so a binary
+    search is a handful of vectorized AND/OR operations over a few hundred bytes.
+    """
+
+    def __init__(self):
+        self.nbytes = 0
+        self.bitsets = {}
+
+    @classmethod
+    def from_codes(cls, codes):
+        index = cls()
+        index.nbytes = (len(codes) + 7) // 8
+        for position in range(codes.shape[1]):
+            for value in np.unique(codes[:, position]).tolist():
+                index.bitsets[position, value] = np.packbits(codes[:, position] == value)
+        return index
+
+    def resize(self, slots):
+        nbytes = (slots + 7) // 8
+        if nbytes > self.nbytes:
+            padding = np.zeros(nbytes - self.nbytes, dtype=np.uint8)
+            self.bitsets = {key: np.concatenate([bitset, padding]) for key, bitset in self.bitsets.items()}
+            self.nbytes = nbytes
+
+    def add(self, slot, code):
+        byte, bit = slot >> 3, np.uint8(0x80 >> (slot & 7))
+        for position, value in enumerate(code.tolist()):
+            bitset = self.bitsets.get((position, value))
+            if bitset is None:
+                bitset = self.bitsets[position, value] = np.zeros(self.nbytes, dtype=np.uint8)
+            bitset[byte] |= bit
+
+    def remove(self, slot, code):
+        byte, bit = slot >> 3, ~np.uint8(0x80 >> (slot & 7))
+        for position, value in enumerate(code.tolist()):
+            self.bitsets[position, value][byte] &= bit
+
+    def query(self, code):
+        """Packed bitset of the slots whose code equals `code` or is a wildcard wherever `code` isn't one."""
+        empty = np.zeros(self.nbytes, dtype=np.uint8)
+        result = np.full(self.nbytes, 0xFF, dtype=np.uint8)
+        for position, value in enumerate(code.tolist()):
+            if value != WILDCARD:
+                result &= self.bitsets.get((position, value), empty) | self.bitsets.get((position, WILDCARD), empty)
+        return result
+
+
+def latest_codes(individual_ids=None):
+    """`{individual_id: encoded code}` of the latest SEEK code of `individual_ids`, or of every individual if `None`.
+
+    Individuals without a code are left out.
+    """
+    from .utils import get_individual_seek_identities
+
+    individuals = (
+        Individual.objects.all() if individual_ids is None else Individual.objects.filter(pk__in=individual_ids)
+    )
+    individuals, _ = get_individual_seek_identities(individuals)
+    seek_identity_ids = dict(individuals.values_list("seek_identity_pk", "pk"))
+    return {
+        seek_identity_ids[pk]: encode_values(values)
+        for pk, *values in Seek_Identity.objects.filter(pk__in=seek_identity_ids).values_list("pk", *SEEK_FIELDS)
+    }
+
+
+class SeekMatrix:
+    """Latest SEEK code of every `Individual` that has one, as rows of a uint8 matrix with a `SeekBitmapIndex`.
+
+    Rows live in slots so single codes can be replaced without rebuilding; freed slots are marked with an individual
+    id of -1 and reused. `select` and `candidates` return rows in individual id order.
+    """
+
+    def __init__(self, codes=None):
+        codes = codes or {}
+        self.individual_ids = np.array(sorted(codes), dtype=np.int64)
+        self.codes = np.array([codes[pk] for pk in self.individual_ids.tolist()], dtype=np.uint8).reshape(
+            len(codes), len(SEEK_FIELDS)
+        )
+        self.bitmap = SeekBitmapIndex.from_codes(self.codes)
+
+        self._slots = {pk: slot for slot, pk in enumerate(self.individual_ids.tolist())}
+        self._free = []
+        self._size = len(codes)
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls):
+        return cls(latest_codes())
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _allocate(self):
+        if self._free:
+            return self._free.pop()
+        if self._size == len(self.individual_ids):
+            capacity = max(2 * self._size, 64)
+            self.individual_ids = np.concatenate(
+                [self.individual_ids, np.full(capacity - self._size, -1, dtype=np.int64)]
+            )
+            self.codes = np.concatenate([self.codes, np.zeros((capacity - self._size, len(SEEK_FIELDS)), np.uint8)])
+            self.bitmap.resize(capacity)
+        self._size += 1
+        return self._size - 1
+
+    def update(self, individual_ids):
+        """Reload the codes of `individual_ids` from the database, updating the bitmap index in place."""
+        codes = latest_codes(individual_ids)
+        with self._lock:
+            for individual_id in individual_ids:
+                slot = self._slots.pop(individual_id, None)
+                if slot is not None:
+                    self.bitmap.remove(slot, self.codes[slot])
+                    self.individual_ids[slot] = -1
+                    self._free.append(slot)
+
+                code = codes.get(individual_id)
+                if code is not None:
+                    slot = self._slots[individual_id] = self._allocate()
+                    self.individual_ids[slot] = individual_id
+                    self.codes[slot] = code
+                    self.bitmap.add(slot, code)
+
+    def _rows(self, mask):
+        slots = np.flatnonzero(mask)
+        slots = slots[np.argsort(self.individual_ids[slots])]
+        return self.individual_ids[slots], self.codes[slots]
+
+    def select(self, individual_ids=None):
+        """Ids and codes of the subset of `individual_ids` that have a code, in individual id order."""
+        with self._lock:
+            mask = self.individual_ids >= 0
+            if individual_ids is not None:
+                mask &= np.isin(self.individual_ids, np.fromiter(individual_ids, dtype=np.int64))
+            return self._rows(mask)
+
+    def candidates(self, code, individual_ids=None):
+        """Ids and codes of the individuals whose code matches `code` exactly up to wildcards on either side.
+
+        Parameters
+        ----------
+        code: eb_core.models.Seek_Identity or str or numpy.ndarray
+            Query code, see `encode`.
+        individual_ids: iterable or None
+            Restrict the candidates to these individuals.
+
+        Returns
+        -------
+        tuple
+            Individual ids and their codes, in individual id order.
+        """
+        with self._lock:
+            bits = self.bitmap.query(encode([code])[0])
+            mask = np.unpackbits(bits, count=len(self.individual_ids)).astype(bool) & (self.individual_ids >= 0)
+            if individual_ids is not None:
+                mask &= np.isin(self.individual_ids, np.fromiter(individual_ids, dtype=np.int64))
+            return self._rows(mask)
+
+
+_matrix = None
+_matrix_version = None
+_matrix_lock = threading.Lock()
+
+
+def get_seek_matrix():
+    """Process-wide `SeekMatrix`, brought up to date with the changes any process made since it was last used.
+
+    Changes are replayed from the per-version lists of changed individuals in the cache. If one has expired or was
+    recorded without ids the matrix is rebuilt instead.
+    """
+    global _matrix, _matrix_version
+
+    version = cache.get(VERSION_KEY, 0)
+    with _matrix_lock:
+        if _matrix is not None and _matrix_version != version:
+            keys = [CHANGES_KEY.format(v) for v in range(_matrix_version + 1, version + 1)]
+            changes = cache.get_many(keys) if keys else {}
+            if keys and len(changes) == len(keys):
+                _matrix.update(set().union(*changes.values()))
+                _matrix_version = version
+            else:
+                _matrix = None
+
+        if _matrix is None:
+            _matrix, _matrix_version = SeekMatrix.build(), version
+        return _matrix
+
+
+def invalidate(individual_ids=None):
+    """Record that the latest SEEK code of `individual_ids` (every individual if `None`) changed once the current
+    transaction commits.
+    """
+    if individual_ids is not None:
+        individual_ids = {pk for pk in individual_ids if pk is not None}
+        if not individual_ids:
+            return
+
+    def bump():
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 0, timeout=None)
+            version = cache.incr(VERSION_KEY)
+        if individual_ids is not None:
+            cache.set(CHANGES_KEY.format(version), individual_ids, timeout=CHANGES_TIMEOUT)
+
+    transaction.on_commit(bump)
+    catalogue.bump()
+
+
+@receiver(post_save, sender=Individual_Sighting)
+def individual_sighting_saved(sender, instance, created, **kwargs):
+    # Moving a sighting to another group sighting can change which of its individual's codes is the latest
+    if created or instance.has_changed(*Individual_Sighting.tracked_fields):
+        invalidate([instance.previous("individual_id"), instance.individual_id])
+
+
+@receiver(post_delete, sender=Individual_Sighting)
+def individual_sighting_deleted(sender, instance, **kwargs):
+    invalidate([instance.individual_id])
+
+
+@receiver(post_save, sender=Seek_Identity)
+def seek_identity_saved(sender, instance, **kwargs):
+    invalidate(Individual_Sighting.objects.filter(seek_identity=instance).values_list("individual", flat=True))
+
+
+@receiver(post_delete, sender=Seek_Identity)
+def seek_identity_deleted(sender, instance, **kwargs):
+    invalidate()
+
+
+@receiver(post_delete, sender=Individual)
+def individual_deleted(sender, instance, **kwargs):
+    invalidate([instance.pk])
@@ -0,0 +1,93 @@
+"""Maintenance of `Individual_Summary` rows.
+
+Summaries are recomputed from scratch for the affected individuals inside the transaction that changed them, which
+costs one query per change and keeps them consistent with the sightings they summarize. Edits to a `Seek_Identity` need
+no refresh since summaries only reference it; attaching a new one goes through saving its `Individual_Sighting`.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalogue
+from .models import (
+    LATEST_SIGHTING_ORDERING,
+    Group_Sighting,
+    Individual,
+    Individual_Sighting,
+    Individual_Summary,
+)
+
+SUMMARY_FIELDS = ["latest_seek_identity_id", "num_sightings", "first_seen", "last_seen", "last_lat", "last_lon"]
+
+
+def summarize(individuals):
+    """Unsaved `Individual_Summary` objects computed from the sightings of `individuals`, in one query."""
+    sightings = Individual_Sighting.objects.filter(individual_id=OuterRef("pk"))
+    last_sightings = sightings.order_by(F("group_sighting__datetime").desc(nulls_last=True), "-pk")
+
+    rows = (
+        individuals.order_by()
+        .annotate(
+            summary_latest_seek_identity_id=Subquery(
+                sightings.order_by(*LATEST_SIGHTING_ORDERING).values("seek_identity")[:1]
+            ),
+            summary_num_sightings=Count("individual_sighting", distinct=True),
+            summary_first_seen=Min("individual_sighting__group_sighting__datetime"),
+            summary_last_seen=Max("individual_sighting__group_sighting__datetime"),
+            summary_last_lat=Subquery(last_sightings.values("group_sighting__lat")[:1]),
+            summary_last_lon=Subquery(last_sightings.values("group_sighting__lon")[:1]),
+        )
+        .values_list("pk", *[f"summary_{field}" for field in SUMMARY_FIELDS])
+    )
+
+    return [
+        Individual_Summary(individual_id=pk, **dict(zip(SUMMARY_FIELDS, values))) for pk, *values in rows.iterator()
+    ]
+
+
+def refresh(individual_ids=None):
+    """Recompute the summaries of `individual_ids`, or of every individual if `None`."""
+    individuals = Individual.objects.all()
+    summaries = Individual_Summary.objects.all()
+    if individual_ids is not None:
+        individual_ids = {pk for pk in individual_ids if pk is not None}
+        if not individual_ids:
+            return
+        individuals = individuals.filter(pk__in=individual_ids)
+        summaries = summaries.filter(individual__in=individual_ids)
+
+    with transaction.atomic():
+        # Concurrent refreshes of the same individuals would both delete and then collide on re-insertion
+        list(individuals.select_for_update().order_by("pk").values_list("pk", flat=True))
+        summaries.delete()
+        Individual_Summary.objects.bulk_create(summarize(individuals), batch_size=1000)
+
+
+@receiver(post_save, sender=Individual)
+def individual_saved(sender, instance, created, **kwargs):
+    if created:
+        Individual_Summary.objects.get_or_create(individual=instance)
+
+
+@receiver(post_save, sender=Individual_Sighting)
+def individual_sighting_saved(sender, instance, created, **kwargs):
+    if created or instance.has_changed(*Individual_Sighting.tracked_fields):
+        refresh([instance.previous("individual_id"), instance.individual_id])
+
+
+@receiver(post_delete, sender=Individual_Sighting)
+def individual_sighting_deleted(sender, instance, **kwargs):
+    refresh([instance.individual_id])
+
+
+def group_sighting_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh(instance.individual_sighting_set.values_list("individual", flat=True))
+        # Search filters on dates and regions read group sightings
+        catalogue.bump()
+
+
+# `Group_Sighting` is polymorphic, so subclasses are sent as their own sender
+for sender in (Group_Sighting, *Group_Sighting.__subclasses__()):
+    post_save.connect(group_sighting_saved, sender=sender)
@@ -1,4 +1,7 @@
 import django_tables2 as tables
+import numpy as np
+from django_tables2.data import TableListData
+from django_tables2.utils import OrderBy
 
 from .models import (
     EarthRanger_Sighting,
@@ -7,6 +10,7 @@ from .models import (
     Individual_Sighting,
     Subgroup_Sighting,
 )
+from .utils import ranks, top_k
 
 
 class Float3FColumn(tables.Column):
@@ -85,9 +89,70 @@ class Search_Table(tables.Table):
     )
     score = Float3FColumn()
     seek_score = Float3FColumn()
-    seek_code = tables.Column()
+    seek_code = tables.Column(orderable=False)
     right_ear_emb_score = Float3FColumn()
     left_ear_emb_score = Float3FColumn()
 
     class Meta:
         template_name = "django_tables2/bootstrap-responsive.html"
+
+
+class Ranked_Table_Data(TableListData):
+    """Table data for ranked results that only builds the records of the rows being displayed.
+
+    Rows are ranked by `scores` with ties broken by `ids`, and the rank numbers always refer to that ranking whichever
+    column the table is ordered by. Ordering by a column in `sort_keys` selects the rows of a page with `top_k` too.
+
+    Parameters
+    ----------
+    ids: numpy.ndarray
+        Unique id of each row.
+    scores: numpy.ndarray
+        Score of each row, higher ranks first.
+    build_records: callable
+        Called with the indices of the rows to display and their ranks, returns their records.
+    sort_keys: dict
+        Numeric array for each orderable column other than "rank".
+    """
+
+    def __init__(self, ids, scores, build_records, sort_keys=None):
+        super().__init__(data=None)
+        self.ids = ids
+        self.scores = scores
+        self.build_records = build_records
+        self.sort_keys = sort_keys or {}
+
+        self._key = scores
+        self._ordering = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            key = range(len(self))[key]
+            return self[key : key + 1][0]
+
+        start, stop, step = key.indices(len(self))
+        indices = top_k(self._key, self.ids, stop)[start:stop:step]
+        return self.build_records(indices, ranks(self.scores, self.ids, indices))
+
+    def __iter__(self):
+        return iter(self[:])
+
+    @property
+    def ordering(self):
+        return self._ordering
+
+    def order_by(self, aliases):
+        alias = OrderBy(aliases[0]) if aliases else OrderBy("rank")
+        if alias.bare == "rank":
+            key, descending = self.scores, not alias.is_descending
+        elif alias.bare in self.sort_keys:
+            key, descending = self.sort_keys[alias.bare], alias.is_descending
+        else:
+            return
+
+        # Missing values last in either direction
+        self._key = np.where(np.isnan(key), -np.inf, key if descending else -key)
+        self._ordering = aliases
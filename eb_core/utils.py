@@ -4,10 +4,16 @@ from io import BytesIO
 import numpy as np
 import pandas as pd
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.db.models import OuterRef, Subquery
+from django.db.models import F, OuterRef, Subquery
 from PIL import Image
 
-from .models import Individual, Individual_Sighting, Seek_Identity
+from .models import (
+    LATEST_SIGHTING_ORDERING,
+    Individual,
+    Individual_Sighting,
+    Seek_Identity,
+)
+from .seek import encode, score_codes
 
 EXIF_ORIENTATION = {3: 180, 6: 270, 8: 90}
 
@@ -43,31 +49,47 @@ def compress_image(uploaded_image, maxw=1000, prefix="compressed"):
 
 
 def score_seek(out_code, database_codes, binary=False):
-    out_code = np.array(out_code)
-    database_codes = np.array([np.array(code) for code in database_codes])
+    return score_codes(encode([out_code]), encode(database_codes), binary=binary)[0]
 
-    scores = np.mean(database_codes == out_code, axis=1) - 0.4 * np.mean(database_codes == "?", axis=1)
 
-    # Exclude matches that differ from the given `SEEK_Identity` but don't exclude differences caused by wildcard.
-    if binary:
-        scores[
-            ~np.all((database_codes == out_code) | (database_codes == "?") | (np.array(out_code) == "?"), axis=1)
-        ] = np.NAN
+def top_k(scores, ids, k):
+    """Indices of the `k` highest `scores` in descending order, breaking ties by ascending `ids`.
 
-    return scores
+    `np.argpartition` narrows the entries down to those that can make the top `k`, so only those are sorted.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        threshold = scores[np.argpartition(-scores, k - 1)[:k]].min()
+        candidates = np.flatnonzero(scores >= threshold)  # Keep every tie at the threshold so `ids` decide
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((ids[candidates], -scores[candidates]))][:k]
+
+
+def ranks(scores, ids, indices):
+    """1-based ranks of the entries at `indices` in the ordering `top_k` uses, without sorting everything."""
+    selected_scores = scores[indices][:, None]
+    selected_ids = ids[indices][:, None]
+    return 1 + np.sum((scores > selected_scores) | ((scores == selected_scores) & (ids < selected_ids)), axis=1)
 
 
 def get_individual_seek_identities(individuals=Individual.objects, individual_sightings=Individual_Sighting.objects):
-    individuals = (
-        individuals.annotate(
-            seek_identity_pk=Subquery(
-                individual_sightings.filter(
-                    individual_id=OuterRef("id"),
-                )
-                .order_by("-pk")
-                .values("seek_identity")[:1]
+    if individual_sightings is Individual_Sighting.objects:
+        # Every sighting counts, so the maintained summary already holds the answer
+        seek_identity_pk = F("summary__latest_seek_identity")
+    else:
+        seek_identity_pk = Subquery(
+            individual_sightings.filter(
+                individual_id=OuterRef("id"),
             )
+            .order_by(*LATEST_SIGHTING_ORDERING)
+            .values("seek_identity")[:1]
         )
+
+    individuals = (
+        individuals.annotate(seek_identity_pk=seek_identity_pk)
         .filter(seek_identity_pk__isnull=False)
         .order_by("seek_identity_pk")
     )
@@ -3,8 +3,6 @@ import os
 from collections import defaultdict
 
 import django.db.models.fields
-import numpy as np
-import pandas as pd
 from django.conf import settings
 from django.contrib.auth.mixins import (
     LoginRequiredMixin,
@@ -22,8 +20,8 @@ from django_drf_filepond.models import TemporaryUpload
 from django_tables2 import SingleTableMixin, SingleTableView
 from PIL import Image
 
-from eb_ml.models import Scoring
-from eb_ml.tasks import SCORE_WEIGHTS, associate_bboxes, detect
+from eb_ml.index import suggest_individuals
+from eb_ml.tasks import associate_bboxes, detect
 
 from .forms import (
     Combine_Individual_Form,
@@ -56,20 +54,18 @@ from .models import (
     Sighting_Photo,
     Subgroup_Sighting,
 )
+from .search import search
+from .seek import encode, format_code
 from .tables import (
     EarthRanger_Sighting_Table,
     Group_Sighting_Table,
     Individual_Sighting_Table,
     Individual_Table,
+    Ranked_Table_Data,
     Search_Table,
     Subgroup_Sighting_Table,
 )
-from .utils import (
-    compress_image,
-    get_individual_seek_identities,
-    score,
-    score_seek,
-)
+from .utils import compress_image, score
 
 
 class Index_View(LoginRequiredMixin, generic.TemplateView):
@@ -530,6 +526,13 @@ class Individual_Sighting_View(PermissionRequiredMixin, generic.DetailView):
         except ObjectDoesNotExist:
             context["musth_form"] = Musth_Status_Form()
 
+        # Most similar `Individual` objects by ear embeddings
+        suggestions = suggest_individuals(self.object, k=settings.EB_ML_SUGGESTIONS)
+        individuals = Individual.objects.in_bulk([individual_id for individual_id, _ in suggestions])
+        context["suggestions"] = [
+            (individuals[individual_id], score) for individual_id, score in suggestions if individual_id in individuals
+        ]
+
         return context
 
     def post(self, request, *args, **kwargs):
@@ -799,61 +802,58 @@ class Search_View(PermissionRequiredMixin, SingleTableMixin, generic.TemplateVie
     template_name = "search/view.html"
 
     table_class = Search_Table
-    table_pagination = False
+    table_pagination = {"per_page": 25}
 
     def get_table_data(self):
-
-        individuals = Individual.objects.filter(individual_sighting__isnull=False).distinct()
-
-        if self.request.GET.get("region"):
-            individuals = individuals.filter(
-                individual_sighting__group_sighting__json__event_details__RegionName=self.request.GET["region"]
-            )
-
-        individuals, seek_identities = get_individual_seek_identities(individuals)
-
-        if not individuals.exists():
-            return
-
-        seek_scores = score_seek(
-            Seek_Identity_Form(self.request.GET).save(commit=False),
-            [np.array(seek_identity) for seek_identity in seek_identities],
-            binary="binary" in self.request.GET and self.request.GET["binary"] == "on",
+        form = Search_Form(self.request.GET)
+        form.is_valid()  # Invalid or missing filters are left out of `cleaned_data` and not applied
+        filters = form.cleaned_data
+
+        self.results = search(
+            encode([Seek_Identity_Form(self.request.GET).save(commit=False)])[0],
+            individual_sighting_id=self.request.GET.get("individual_sighting") or None,
+            binary=self.request.GET.get("binary") == "on",
+            region=self.request.GET.get("region") or None,
+            match_gender_age=filters.get("match_gender_age", False),
+            seen_after=filters.get("seen_after"),
+            seen_before=filters.get("seen_before"),
+        )
+        individual_ids, seek_codes, scores, columns = (
+            self.results.individual_ids,
+            self.results.seek_codes,
+            self.results.scores,
+            self.results.columns,
         )
 
-        df = pd.DataFrame(
-            {
-                "individual": individuals,
-                "seek_code": [str(seek_identity) for seek_identity in seek_identities],
-                "score": seek_scores,
-                "seek_score": seek_scores,
-            },
-            index=individuals.values_list("pk", flat=True),
-        ).dropna()
-
-        try:
-            scoring_df = pd.DataFrame(
-                Scoring.objects.get(individual_sighting_id=self.request.GET["individual_sighting"]).data
-            )
-            scoring_df.set_index(scoring_df.pop("individual").values, inplace=True)
-            df = df.drop(columns="score").join(scoring_df.drop(columns=["seek_code", "seek_score"]))
-
-            scores = df[SCORE_WEIGHTS.keys()].values.astype(np.float32).T
-            df["score"] = np.ma.average(
-                np.ma.MaskedArray(scores, mask=np.isnan(scores)), weights=list(SCORE_WEIGHTS.values()), axis=0
-            )
-        except (KeyError, ObjectDoesNotExist):
-            pass
-
-        df = df.sort_values("score", ascending=False, ignore_index=True)
-        df["rank"] = df.index + 1
+        def build_records(indices, ranks):
+            individuals = Individual.objects.in_bulk(individual_ids[indices].tolist())
+            return [
+                {
+                    "rank": int(rank),
+                    "individual": individuals.get(int(individual_ids[i])),
+                    "seek_code": format_code(seek_codes[i]),
+                    "score": float(scores[i]),
+                    **{column: float(values[i]) for column, values in columns.items()},
+                }
+                for i, rank in zip(indices, ranks)
+            ]
 
-        return df.to_dict("records")
+        # Only the rows of the displayed page are ranked and turned into records
+        return Ranked_Table_Data(
+            individual_ids,
+            scores,
+            build_records,
+            sort_keys={"score": scores, "individual": individual_ids.astype(float)} | columns,
+        )
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context["form"] = Search_Form(self.request.GET)
+        context |= {
+            "form": Search_Form(self.request.GET),
+            # Candidates left and time taken by each stage of the search
+            "plan": self.results.stages,
+        }
 
         return context
 
@@ -1,20 +1,32 @@
 from django.conf import settings
+from django.db.models import Prefetch
 from rest_framework import permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from eb_core.models import Individual
+from eb_core.models import Individual, Individual_Sighting
 
 
 class Dump_View(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, format=None):
+        individuals = (
+            Individual.objects.filter(summary__num_sightings__gt=0)
+            .select_related("summary__latest_seek_identity", "profile")
+            .prefetch_related(
+                Prefetch(
+                    "individual_sighting_set",
+                    queryset=Individual_Sighting.objects.select_related("group_sighting"),
+                )
+            )
+        )
+
         dump = [
             {
                 "name": individual.name,
                 "id": individual.id,
-                "seek": str(individual.individual_sighting_set.latest().seek_identity),
+                "seek": str(individual.summary.latest_seek_identity),
                 "pfp": "" if individual.profile is None else individual.profile.compressed_image.url,
                 "sightings": [
                     {
@@ -25,8 +37,7 @@ class Dump_View(APIView):
                     for individual_sighting in individual.individual_sighting_set.all()
                 ],
             }
-            for individual in Individual.objects.all()
-            if individual.individual_sighting_set.exists()
+            for individual in individuals
         ]
 
         return Response(dump)
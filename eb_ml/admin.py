@@ -1,7 +1,50 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+
+from eb_core.forms import Combine_Individual_Form
+
+from .models import (
+    Bbox_ML,
+    Duplicate_Candidate,
+    Embedding,
+    Embedding_Centroid,
+    Photo_ML,
+    Scoring_Change,
+)
+
+
+class Duplicate_Candidate_Admin(admin.ModelAdmin):
+    def merge(self, request, queryset):
+        """Combine each selected pair into its lower id individual, like `Individual_Combine`."""
+        for duplicate_candidate in queryset.select_related("individual", "other_individual"):
+            form = Combine_Individual_Form(
+                {"correct": duplicate_candidate.individual_id, "duplicate": duplicate_candidate.other_individual_id}
+            )
+            if form.is_valid():
+                form.save()
+            else:
+                self.message_user(request, f"Could not merge {duplicate_candidate}", level=messages.ERROR)
+
+    def dismiss(self, request, queryset):
+        queryset.update(dismissed=True)
+
+    actions = [merge, dismiss]
+    list_display = [
+        "individual",
+        "other_individual",
+        "score",
+        "seek_score",
+        "right_ear_emb_score",
+        "left_ear_emb_score",
+        "dismissed",
+    ]
+    list_filter = ["dismissed"]
+    list_select_related = ["individual", "other_individual"]
+    search_fields = ["=individual__name", "=other_individual__name"]
 
-from .models import Bbox_ML, Embedding, Photo_ML
 
 admin.site.register(Photo_ML)
 admin.site.register(Bbox_ML)
 admin.site.register(Embedding)
+admin.site.register(Embedding_Centroid)
+admin.site.register(Scoring_Change)
+admin.site.register(Duplicate_Candidate, Duplicate_Candidate_Admin)
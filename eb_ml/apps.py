@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EbMlConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "eb_ml"
+
+    def ready(self):
+        from . import centroids, rescoring  # noqa: F401
@@ -0,0 +1,195 @@
+"""Pre-serialized TorchScript models, loaded without `torch.hub` or any network access.
+
+`build_model_artifacts` traces every model holder in `eb_ml.tasks` into `settings.EB_ML_ARTIFACT_DIR` and records each
+file with its SHA-256 checksum in a manifest. Loaders prefer an artifact whose checksum matches the manifest and only
+fall back to `torch.hub` when there is none and `settings.EB_ML_OFFLINE` is off.
+
+YOLOv5 detectors are traced without their `AutoShape` wrapper, so `ScriptedYOLOv5` reproduces its letterboxing and
+non-maximum suppression and exposes the same `xywhn` results.
+"""
+import json
+import logging
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torchvision
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image
+
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def _manifest_path():
+    return os.path.join(settings.EB_ML_ARTIFACT_DIR, MANIFEST_FILE)
+
+
+_manifest = (None, {})  # Stat key of the manifest file and its parsed models
+
+
+def read_manifest():
+    """`{model_name: entry}` of the artifact store, empty if it has not been built.
+
+    The manifest is parsed once per process and only re-read once the file changes, e.g. after a rebuild.
+    """
+    global _manifest
+    try:
+        stat = os.stat(_manifest_path())
+    except FileNotFoundError:
+        return {}
+    key = (stat.st_mtime_ns, stat.st_size)
+    if _manifest[0] != key:
+        with open(_manifest_path()) as f:
+            _manifest = (key, json.load(f)["models"])
+    return dict(_manifest[1])
+
+
+def write_manifest(models):
+    os.makedirs(settings.EB_ML_ARTIFACT_DIR, exist_ok=True)
+    tmp_path = f"{_manifest_path()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"torch": torch.__version__, "created": timezone.now().isoformat(), "models": models}, f, indent=2)
+    os.replace(tmp_path, _manifest_path())
+
+
+def find(model_name):
+    """Path and manifest entry of the artifact for `model_name`, or `None` if there is no valid one.
+
+    Raises
+    ------
+    ArtifactError
+        If there is no valid artifact and `settings.EB_ML_OFFLINE` forbids falling back to `torch.hub`.
+    """
+    entry = read_manifest().get(model_name)
+    if entry is not None:
+        path = os.path.join(settings.EB_ML_ARTIFACT_DIR, entry["file"])
+        if not os.path.exists(path):
+            logger.warning("Model artifact %s is missing", path)
+        elif registry.checksum(path) != entry["sha256"]:
+            logger.warning("Model artifact %s does not match its manifest checksum", path)
+        else:
+            return path, entry
+
+    if settings.EB_ML_OFFLINE:
+        raise ArtifactError(f"No valid artifact for model {model_name}, run `manage.py build_model_artifacts`")
+    return None
+
+
+def letterbox(image, size):
+    """Resize `image` to fit a `size` square, keeping its aspect ratio and padding the rest like YOLOv5.
+
+    Returns
+    -------
+    tuple
+        CHW float tensor in [0, 1], the scale factor and the x and y padding in pixels.
+    """
+    image = image.convert("RGB")
+    scale = size / max(image.width, image.height)
+    width, height = round(image.width * scale), round(image.height * scale)
+    pad_x, pad_y = (size - width) // 2, (size - height) // 2
+
+    canvas = Image.new("RGB", (size, size), (114, 114, 114))
+    canvas.paste(image.resize((width, height), Image.BILINEAR), (pad_x, pad_y))
+    tensor = torch.from_numpy(np.asarray(canvas)).permute(2, 0, 1).float() / 255
+    return tensor, scale, pad_x, pad_y
+
+
+class ScriptedYOLOv5:
+    """A traced YOLOv5 network with `AutoShape`'s default pre- and post-processing.
+
+    Calling it with a list of PIL images returns an object whose `xywhn` holds one `(x, y, w, h, conf, cls)` tensor per
+    image in normalized coordinates, like the `torch.hub` model. The trace fixes the input to a `size` square, where
+    `AutoShape` pads each batch to a stride-rounded rectangle, so boxes can shift slightly; `manage.py
+    check_detector_parity` measures the difference.
+    """
+
+    def __init__(self, module, size=640, conf=0.25, iou=0.45, max_det=1000):
+        self.module = module
+        self.size = size
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    def _postprocess(self, prediction, image, scale, pad_x, pad_y):
+        # `prediction` rows are (x, y, w, h, objectness, class scores...) in letterboxed pixels
+        prediction = prediction[prediction[:, 4] > self.conf]
+        class_scores = prediction[:, 5:] * prediction[:, 4:5]
+        conf, cls = class_scores.max(dim=1)
+        keep = conf > self.conf
+        prediction, conf, cls = prediction[keep], conf[keep], cls[keep]
+
+        boxes = torchvision.ops.box_convert(prediction[:, :4], "cxcywh", "xyxy")
+        keep = torchvision.ops.batched_nms(boxes, conf, cls, self.iou)[: self.max_det]
+        boxes, conf, cls = boxes[keep], conf[keep], cls[keep]
+
+        # Undo the letterbox, clip to the image and normalize
+        boxes = (boxes - torch.tensor([pad_x, pad_y, pad_x, pad_y])) / scale
+        boxes[:, 0::2] = boxes[:, 0::2].clamp(0, image.width)
+        boxes[:, 1::2] = boxes[:, 1::2].clamp(0, image.height)
+        xywh = torchvision.ops.box_convert(boxes, "xyxy", "cxcywh")
+        xywhn = xywh / torch.tensor([image.width, image.height, image.width, image.height])
+        return torch.cat([xywhn, conf[:, None], cls[:, None].float()], dim=1)
+
+    def __call__(self, images):
+        images = list(images)
+        letterboxed = [letterbox(image, self.size) for image in images]
+        with torch.inference_mode():
+            predictions = self.module(torch.stack([tensor for tensor, *_ in letterboxed]))
+        if isinstance(predictions, (list, tuple)):
+            predictions = predictions[0]
+
+        return SimpleNamespace(
+            xywhn=[
+                self._postprocess(prediction, image, *transform)
+                for prediction, image, (_, *transform) in zip(predictions, images, letterboxed)
+            ]
+        )
+
+
+def trace_yolov5(hub_model, path, size=640):
+    """Trace the network inside a `torch.hub` YOLOv5 `AutoShape` model to `path`."""
+    network = hub_model.model
+    # `DetectMultiBackend` wraps the `DetectionModel` in recent YOLOv5 versions
+    network = getattr(network, "model", network) if hasattr(network, "pt") else network
+    network.model[-1].export = True  # Only return the concatenated predictions
+    network.eval()
+
+    example = torch.zeros(2, 3, size, size)
+    with torch.no_grad():
+        traced = torch.jit.trace(network, example, strict=False)
+        predictions = traced(example)
+    predictions = predictions[0] if isinstance(predictions, (list, tuple)) else predictions
+    if predictions.shape[0] != len(example):
+        raise ArtifactError(f"Traced YOLOv5 returned {predictions.shape[0]} predictions for {len(example)} images")
+    traced.save(path)
+    return {"kind": "yolov5", "size": size}
+
+
+def trace_module(module, path, example, freeze=False):
+    """Trace the `torch.nn.Module` `module` on `example` to `path`, optionally freezing it to fold batch norms."""
+    module.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(module, example)
+        if freeze:
+            traced = torch.jit.freeze(traced)
+        traced.save(path)
+    return {"kind": "module", "input_shape": list(example.shape[1:])}
+
+
+def load(path, entry):
+    """Load an artifact written by `trace_yolov5` or `trace_module`."""
+    module = torch.jit.load(path, map_location="cpu")
+    module.eval()
+    if entry["kind"] == "yolov5":
+        return ScriptedYOLOv5(module, size=entry["size"])
+    return module
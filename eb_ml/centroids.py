@@ -0,0 +1,216 @@
+"""Maintenance of `Embedding_Centroid` rows.
+
+New embeddings and `Individual_Sighting` reassignments are applied as deltas to the stored sums and counts.
+Deletions and changes to which `Bounding_Box` a `Bbox_ML` is associated with are hard to express as deltas once the
+rows are gone, so the affected individuals are collected during the transaction and recomputed from their embeddings
+once it commits.
+"""
+import threading
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from eb_core.models import (
+    Individual,
+    Individual_Sighting,
+    Sighting_Bounding_Box,
+)
+
+from .models import Bbox_ML, Embedding, Embedding_Centroid
+from .rescoring import record_changes
+
+# Lookups from `Bbox_ML`/`Embedding` to the `Individual` the bounding box was assigned to
+BBOX_INDIVIDUAL_LOOKUP = "bounding_box__sighting_bounding_box__individual_sighting__individual"
+INDIVIDUAL_LOOKUP = f"bbox_ml__{BBOX_INDIVIDUAL_LOOKUP}"
+
+
+def _lock_individuals(individual_ids=None):
+    """Lock the rows of `individual_ids` (every individual if `None`) until the current transaction ends.
+
+    Deltas and rebuilds of the same individual's centroids then run one after the other, so a rebuild never reads
+    embeddings whose delta is applied after it, or loses a delta applied while it runs.
+    """
+    individuals = Individual.objects.select_for_update().order_by("pk")
+    if individual_ids is not None:
+        individuals = individuals.filter(pk__in=individual_ids)
+    list(individuals.values_list("pk", flat=True))
+
+
+def sum_embeddings(rows):
+    """Group `(individual_id, cls, vector)` rows into `{(individual_id, cls): (sum, count)}`."""
+    grouped = defaultdict(list)
+    for individual_id, emb_cls, vector in rows:
+        grouped[individual_id, emb_cls].append(vector)
+    return {
+        key: (Embedding.stack(vectors).sum(axis=0, dtype=np.float64), len(vectors)) for key, vectors in grouped.items()
+    }
+
+
+def apply_deltas(deltas):
+    """Add `{(individual_id, cls): (sum, count)}` deltas to the stored centroids, creating rows as needed."""
+    deltas = {key: delta for key, delta in deltas.items() if key[0] is not None and delta[1]}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        _lock_individuals({individual_id for individual_id, _ in deltas})
+        centroids = {
+            (centroid.individual_id, centroid.cls): centroid
+            for centroid in Embedding_Centroid.objects.select_for_update().filter(
+                individual_id__in={individual_id for individual_id, _ in deltas},
+                cls__in={emb_cls for _, emb_cls in deltas},
+            )
+        }
+
+        created, updated, emptied = [], [], []
+        for (individual_id, emb_cls), (delta_sum, delta_count) in deltas.items():
+            centroid = centroids.get((individual_id, emb_cls))
+            if centroid is None:
+                if delta_count > 0:
+                    created.append(
+                        Embedding_Centroid(
+                            individual_id=individual_id,
+                            cls=emb_cls,
+                            count=delta_count,
+                            sum=np.asarray(delta_sum, dtype=np.float64).tobytes(),
+                        )
+                    )
+            elif centroid.count + delta_count <= 0:
+                emptied.append(centroid.pk)
+            else:
+                centroid.count += delta_count
+                centroid.sum = (centroid.sum_array + delta_sum).tobytes()
+                centroid.updated = timezone.now()  # `bulk_update` skips `auto_now`
+                updated.append(centroid)
+
+        Embedding_Centroid.objects.bulk_create(created)
+        Embedding_Centroid.objects.bulk_update(updated, ["count", "sum", "updated"])
+        Embedding_Centroid.objects.filter(pk__in=emptied).delete()
+        record_changes(individual_ids={individual_id for individual_id, _ in deltas})
+
+
+def add_embeddings(embeddings):
+    """Add freshly created embeddings to the centroids of the individuals their bounding boxes belong to."""
+    individual_ids = dict(
+        Bbox_ML.objects.non_polymorphic()
+        .filter(pk__in={embedding.bbox_ml_id for embedding in embeddings})
+        .values_list("pk", BBOX_INDIVIDUAL_LOOKUP)
+    )
+    apply_deltas(
+        sum_embeddings(
+            (individual_ids.get(embedding.bbox_ml_id), embedding.cls, embedding.vector) for embedding in embeddings
+        )
+    )
+
+
+def rebuild(individual_ids=None):
+    """Recompute centroids from scratch for `individual_ids`, or for every individual if `None`."""
+    embeddings = Embedding.objects.filter(vector__isnull=False, **{f"{INDIVIDUAL_LOOKUP}__isnull": False})
+    centroids = Embedding_Centroid.objects.all()
+    if individual_ids is not None:
+        embeddings = embeddings.filter(**{f"{INDIVIDUAL_LOOKUP}__in": individual_ids})
+        centroids = centroids.filter(individual__in=individual_ids)
+
+    with transaction.atomic():
+        _lock_individuals(individual_ids)
+        sums = sum_embeddings(embeddings.values_list(INDIVIDUAL_LOOKUP, "cls", "vector").iterator())
+        centroids.delete()
+        Embedding_Centroid.objects.bulk_create(
+            [
+                Embedding_Centroid(individual_id=individual_id, cls=emb_cls, count=count, sum=total.tobytes())
+                for (individual_id, emb_cls), (total, count) in sums.items()
+            ],
+            batch_size=1000,
+        )
+        if individual_ids is not None:
+            record_changes(individual_ids=individual_ids)
+
+
+_pending = threading.local()
+
+
+def mark_dirty(individual_ids=(), individual_sighting_ids=(), bounding_box_ids=(), bbox_ml_ids=()):
+    """Schedule the individuals behind the given objects to be rebuilt once the current transaction commits.
+
+    Objects are only resolved to individuals at commit time, so this is cheap to call from signal handlers.
+    """
+    pending = getattr(_pending, "ids", None)
+    if pending is None:
+        pending = _pending.ids = defaultdict(set)
+
+    pending["individual"].update(individual_ids)
+    pending["individual_sighting"].update(individual_sighting_ids)
+    pending["bounding_box"].update(bounding_box_ids)
+    pending["bbox_ml"].update(bbox_ml_ids)
+
+    # Registered on every call, as a rolled back transaction or savepoint drops its callbacks. The first callback of a
+    # commit flushes everything pending and the others find nothing left.
+    transaction.on_commit(_flush)
+
+
+def _flush():
+    pending = getattr(_pending, "ids", None)
+    _pending.ids = None
+    if pending is None:
+        return
+
+    individual_ids = set(pending["individual"])
+    individual_ids.update(
+        Individual_Sighting.objects.filter(pk__in=pending["individual_sighting"]).values_list("individual", flat=True)
+    )
+    individual_ids.update(
+        Sighting_Bounding_Box.objects.non_polymorphic()
+        .filter(pk__in=pending["bounding_box"])
+        .values_list("individual_sighting__individual", flat=True)
+    )
+    individual_ids.update(
+        Bbox_ML.objects.non_polymorphic()
+        .filter(pk__in=pending["bbox_ml"])
+        .values_list(BBOX_INDIVIDUAL_LOOKUP, flat=True)
+    )
+    individual_ids.discard(None)
+
+    if individual_ids:
+        rebuild(individual_ids)
+
+
+@receiver(post_save, sender=Individual_Sighting)
+def move_individual_sighting_embeddings(sender, instance, created, **kwargs):
+    if created or not instance.has_changed("individual_id"):
+        return
+    previous_individual_id = instance.previous("individual_id")
+
+    deltas = {}
+    for (_, emb_cls), (total, count) in sum_embeddings(
+        (None, emb_cls, vector)
+        for emb_cls, vector in Embedding.objects.filter(
+            vector__isnull=False, bbox_ml__bounding_box__sighting_bounding_box__individual_sighting=instance
+        ).values_list("cls", "vector")
+    ).items():
+        deltas[previous_individual_id, emb_cls] = (-total, -count)
+        deltas[instance.individual_id, emb_cls] = (total, count)
+    apply_deltas(deltas)
+
+
+@receiver(pre_delete, sender=Individual_Sighting)
+def individual_sighting_deleted(sender, instance, **kwargs):
+    mark_dirty(individual_ids=[instance.individual_id])
+
+
+@receiver(pre_delete, sender=Sighting_Bounding_Box)
+def sighting_bounding_box_deleted(sender, instance, **kwargs):
+    mark_dirty(individual_sighting_ids=[instance.individual_sighting_id])
+
+
+@receiver(pre_delete, sender=Bbox_ML)
+def bbox_ml_deleted(sender, instance, **kwargs):
+    mark_dirty(bounding_box_ids=[instance.bounding_box_id])
+
+
+@receiver(pre_delete, sender=Embedding)
+def embedding_deleted(sender, instance, **kwargs):
+    mark_dirty(bbox_ml_ids=[instance.bbox_ml_id])
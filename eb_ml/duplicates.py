@@ -0,0 +1,197 @@
+"""Detection of individuals that are likely to be the same elephant.
+
+Every individual is scored against every other on the `SCORE_WEIGHTS` scale, from the embedding centroids held by the
+`EmbeddingIndex` of each ear and the latest SEEK codes held by the `SeekMatrix`. The score matrix is never materialized:
+it is computed one block of rows and columns at a time with a matrix product per ear class, and each row only keeps a
+running top-K, so memory stays at `O(block_size ** 2 + individuals * k)` whatever the size of the catalogue.
+"""
+import logging
+import time
+
+import numpy as np
+from django.db import transaction
+
+from eb_core.models import Individual
+from eb_core.seek import get_seek_matrix, score_code_pairs, score_codes
+
+from .index import get_index
+from .models import Duplicate_Candidate
+
+logger = logging.getLogger(__name__)
+
+
+def _aligned(individual_ids, ids, rows):
+    """Rows of `rows` (indexed like `ids`) scattered into the order of the sorted `individual_ids`, with a presence
+    mask.
+    """
+    aligned = np.zeros((len(individual_ids),) + rows.shape[1:], dtype=rows.dtype)
+    present = np.zeros(len(individual_ids), dtype=bool)
+    if len(ids):
+        positions = np.searchsorted(individual_ids, ids)
+        aligned[positions] = rows
+        present[positions] = True
+    return aligned, present
+
+
+def _merge_top_k(best_scores, best_columns, scores, columns, k):
+    """Merge a block of candidate `scores` (rows, block columns) into the running per-row top-`k`."""
+    scores = np.concatenate([best_scores, scores], axis=1)
+    columns = np.concatenate([best_columns, np.broadcast_to(columns, (len(scores), len(columns)))], axis=1)
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        columns = np.take_along_axis(columns, top, axis=1)
+    return scores, columns
+
+
+def find_duplicates(weights, emb_classes, k=5, block_size=1024, min_score=None):
+    """Most similar pairs of individuals, each individual contributing its `k` best matches.
+
+    Parameters
+    ----------
+    weights: dict
+        Weight per score component, as `eb_ml.tasks.SCORE_WEIGHTS`.
+    emb_classes: dict
+        `Embedding.cls` of each ear embedding component of `weights`, as `eb_ml.tasks.EMB_SCORE_CLASSES`.
+    k: int
+        Candidates kept per individual.
+    block_size: int
+        Rows and columns of the score matrix computed at a time.
+    min_score: float or None
+        Pairs scoring below this are dropped.
+
+    Returns
+    -------
+    list
+        `(individual_id, individual_id, score, components)` tuples with the smaller id first, best first, where
+        `components` maps each component of `weights` to its score or NaN.
+    """
+    start = time.perf_counter()
+
+    seek_ids, seek_codes = get_seek_matrix().select()
+    indexes = {column: get_index(emb_cls) for column, emb_cls in emb_classes.items() if column in weights}
+    individual_ids = np.unique(np.concatenate([seek_ids] + [index.ids for index in indexes.values()]))
+    n = len(individual_ids)
+
+    # Every component as an aligned matrix and presence mask
+    codes, has_code = _aligned(individual_ids, seek_ids, seek_codes)
+    embeddings = {}
+    for column, index in indexes.items():
+        embeddings[column] = _aligned(individual_ids, *index.snapshot())
+
+    # SEEK scores only penalize wildcards on the database side, so pairs are scored both ways and averaged to make
+    # a pair's score independent of which individual is the query
+    def component_scores(rows, columns):
+        """Score of each component for a block, NaN where either side lacks it."""
+        components = {}
+        if "seek_score" in weights:
+            block = (score_codes(codes[rows], codes[columns]) + score_codes(codes[columns], codes[rows]).T) / 2
+            block[~(has_code[rows, None] & has_code[None, columns])] = np.nan
+            components["seek_score"] = block
+        for column, (matrix, present) in embeddings.items():
+            block = 0.5 + matrix[rows] @ matrix[columns].T / 2
+            block[~(present[rows, None] & present[None, columns])] = np.nan
+            components[column] = block
+        return components
+
+    def pair_scores(rows, columns):
+        """Score of each component for the pairs `(rows[p], columns[p])`, NaN where either side lacks it."""
+        components = {}
+        if "seek_score" in weights:
+            pairs = (score_code_pairs(codes[rows], codes[columns]) + score_code_pairs(codes[columns], codes[rows])) / 2
+            pairs[~(has_code[rows] & has_code[columns])] = np.nan
+            components["seek_score"] = pairs
+        for column, (matrix, present) in embeddings.items():
+            pairs = 0.5 + np.einsum("ij,ij->i", matrix[rows], matrix[columns]) / 2
+            pairs[~(present[rows] & present[columns])] = np.nan
+            components[column] = pairs
+        return components
+
+    def total_scores(components):
+        total = np.zeros(next(iter(components.values())).shape)
+        total_weight = np.zeros_like(total)
+        for column, block in components.items():
+            present = ~np.isnan(block)
+            total += weights[column] * np.where(present, block, 0)
+            total_weight += weights[column] * present
+        with np.errstate(invalid="ignore"):
+            return total / total_weight
+
+    pairs = set()
+    k = min(k, max(n - 1, 0))
+    for row_start in range(0, n if k else 0, block_size):
+        rows = np.arange(row_start, min(row_start + block_size, n))
+        best_scores = np.full((len(rows), 0), -np.inf)
+        best_columns = np.empty((len(rows), 0), dtype=np.int64)
+
+        for column_start in range(0, n, block_size):
+            columns = np.arange(column_start, min(column_start + block_size, n))
+            scores = total_scores(component_scores(rows, columns))
+            scores[np.isnan(scores) | (rows[:, None] == columns[None, :])] = -np.inf
+            best_scores, best_columns = _merge_top_k(best_scores, best_columns, scores, columns, k)
+
+        for row, row_scores, row_columns in zip(rows.tolist(), best_scores, best_columns):
+            for score, column in zip(row_scores.tolist(), row_columns.tolist()):
+                if score > -np.inf and (min_score is None or score >= min_score):
+                    pairs.add((min(row, column), max(row, column)))
+
+    if not pairs:
+        return []
+
+    # Components of the kept pairs only, so they can be shown next to each candidate for review, and the score stored
+    # with them recomputed from those same components
+    first, second = (np.array(side, dtype=np.int64) for side in zip(*sorted(pairs)))
+    components = {column: [] for column in ["seek_score", *embeddings] if column in weights}
+    scores = []
+    for start_pair in range(0, len(first), block_size):
+        chunk = slice(start_pair, start_pair + block_size)
+        chunk_components = pair_scores(first[chunk], second[chunk])
+        scores.extend(total_scores(chunk_components).tolist())
+        for column, values in chunk_components.items():
+            components[column].extend(values.tolist())
+
+    duplicates = sorted(
+        (
+            (
+                int(individual_ids[i]),
+                int(individual_ids[j]),
+                score,
+                {column: values[p] for column, values in components.items()},
+            )
+            for p, (i, j, score) in enumerate(zip(first.tolist(), second.tolist(), scores))
+        ),
+        key=lambda duplicate: -duplicate[2],
+    )
+
+    logger.info(
+        "Found %d candidate duplicate pairs among %d individuals in %.2fs",
+        len(duplicates),
+        n,
+        time.perf_counter() - start,
+    )
+    return duplicates
+
+
+def save_duplicates(duplicates):
+    """Replace the open `Duplicate_Candidate` review list with `duplicates`, keeping dismissed pairs dismissed."""
+    existing_ids = set(
+        Individual.objects.filter(pk__in={pk for duplicate in duplicates for pk in duplicate[:2]}).values_list(
+            "pk", flat=True
+        )
+    )
+    with transaction.atomic():
+        Duplicate_Candidate.objects.filter(dismissed=False).delete()
+        Duplicate_Candidate.objects.bulk_create(
+            [
+                Duplicate_Candidate(
+                    individual_id=individual_id,
+                    other_individual_id=other_individual_id,
+                    score=score,
+                    **{column: None if np.isnan(value) else value for column, value in components.items()},
+                )
+                for individual_id, other_individual_id, score, components in duplicates
+                if individual_id in existing_ids and other_individual_id in existing_ids
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
@@ -0,0 +1,217 @@
+"""Inference executor: one long-lived process owning the models, shared by every Celery task over a unix socket.
+
+Tasks send their images or ear crops to the executor, which queues requests per operation and runs them in
+micro-batches. A batch is run once it holds `max_batch` items or once its oldest request has waited `max_latency`
+seconds, so small uploads from concurrent tasks are batched together. A single copy of each model uses every core
+through intra-op parallelism, instead of one copy per prefork worker process.
+
+Messages are length-prefixed pickles. The socket must only be reachable by trusted local processes.
+"""
+import logging
+import os
+import pickle
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from .utils import batched
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("!Q")
+
+
+class InferenceError(Exception):
+    pass
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError("Inference executor connection closed")
+        view = view[received:]
+    return buffer
+
+
+def send_message(sock, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(data)))
+    sock.sendall(data)
+
+
+def recv_message(sock):
+    (size,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    return pickle.loads(_recv_exactly(sock, size))
+
+
+class MicroBatcher:
+    """Runs `function` over the items of queued requests in batches bounded by size and waiting time."""
+
+    def __init__(self, name, function, max_batch, max_latency):
+        self.name = name
+        self.function = function
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True).start()
+
+    def submit(self, items):
+        """`Future` of `function`'s results for `items`, in order."""
+        future = Future()
+        self._queue.put((list(items), future))
+        return future
+
+    def _collect(self):
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_latency
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            items = [item for request_items, _ in requests for item in request_items]
+
+            start = time.perf_counter()
+            try:
+                results = []
+                for batch in batched(items, self.max_batch):
+                    results.extend(self.function(batch))
+            except Exception as e:
+                logger.exception("Inference batch %s failed", self.name)
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_items, future in requests:
+                future.set_result(results[offset : offset + len(request_items)])
+                offset += len(request_items)
+
+            self.batches += 1
+            self.items += len(items)
+            logger.debug(
+                "%s: %d items from %d requests in %.3fs (%.1f items per batch overall)",
+                self.name,
+                len(items),
+                len(requests),
+                time.perf_counter() - start,
+                self.items / self.batches,
+            )
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves `operations`, a `{name: function}` mapping of batch functions, one `MicroBatcher` each."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, operations, max_batch, max_latency):
+        self.batchers = {
+            name: MicroBatcher(name, function, max_batch, max_latency) for name, function in operations.items()
+        }
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        super().__init__(socket_path, InferenceHandler)
+
+
+class InferenceHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                operation, items = recv_message(self.request)
+            except ConnectionError:
+                return
+
+            batcher = self.server.batchers.get(operation)
+            if batcher is None:
+                send_message(self.request, ("error", f"Unknown operation {operation}"))
+                continue
+            try:
+                send_message(self.request, ("ok", batcher.submit(items).result()))
+            except Exception as e:
+                send_message(self.request, ("error", repr(e)))
+
+
+class InferenceClient:
+    """Connection to the inference executor, one per thread."""
+
+    def __init__(self, socket_path, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _socket(self):
+        sock = getattr(self._local, "socket", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.socket = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "socket", None)
+        if sock is not None:
+            sock.close()
+            self._local.socket = None
+
+    def run(self, operation, items):
+        """Results of `operation` for each of `items`, reconnecting once if the executor was restarted.
+
+        Raises
+        ------
+        InferenceError
+            If the executor fails `operation`, cannot be reached or does not answer within `timeout` seconds.
+        """
+        for attempt in range(2):
+            try:
+                sock = self._socket()
+                send_message(sock, (operation, list(items)))
+                status, result = recv_message(sock)
+                break
+            except socket.timeout as e:
+                # A late answer would be read as the answer to the next request, so the connection is dropped
+                self._close()
+                raise InferenceError(f"Inference executor did not answer {operation} within {self.timeout}s") from e
+            except (ConnectionError, FileNotFoundError, BrokenPipeError) as e:
+                self._close()
+                if attempt:
+                    raise InferenceError(f"Inference executor at {self.socket_path} is unreachable") from e
+        if status != "ok":
+            raise InferenceError(result)
+        return result
+
+
+_client = None
+
+
+def get_client():
+    """Shared `InferenceClient`, or `None` if `settings.EB_ML_INFERENCE_SOCKET` is unset and models run in-process."""
+    global _client
+    if not settings.EB_ML_INFERENCE_SOCKET:
+        return None
+    if _client is None:
+        _client = InferenceClient(settings.EB_ML_INFERENCE_SOCKET, settings.EB_ML_INFERENCE_TIMEOUT)
+    return _client
@@ -0,0 +1,93 @@
+"""Identification of individuals straight from a photo, without storing anything.
+
+The ear detector and the ear feature extractor run in the calling process on the models kept warm by `registry`, and
+candidates are ranked against the in-memory `EmbeddingIndex` of each ear, so an answer costs one detector pass, one
+batched extractor pass and a matrix-vector product per ear.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from PIL import ImageOps
+
+from . import executor
+from .index import get_index, rank_individuals
+from .models import Ear_Bbox, Embedding
+from .tasks import (
+    EarDetector,
+    LeftEarFeatureExtractor,
+    RightEarFeatureExtractor,
+)
+
+logger = logging.getLogger(__name__)
+
+FEATURE_EXTRACTORS = [RightEarFeatureExtractor, LeftEarFeatureExtractor]
+
+
+def warm_up():
+    """Load the models and indexes `identify` needs."""
+    # Models live in the inference executor if there is one
+    if executor.get_client() is None:
+        for model_holder in [EarDetector, RightEarFeatureExtractor]:
+            model_holder.get_model()
+    for emb_cls in Embedding.cls_map:
+        get_index(emb_cls, refresh=False)
+
+
+def identify(image, k=10, ear=None, min_conf=None):
+    """Top-`k` candidate individuals for the elephant in `image`.
+
+    Parameters
+    ----------
+    image: PIL.Image.Image
+        Photo of an elephant, or crop of one of its ears if `ear` is given. Rotated by its EXIF orientation like
+        stored photos.
+    k: int
+        Number of candidates to return.
+    ear: str or None
+        Side of the ear, as in `Ear_Bbox.cls_map`, if `image` is already an ear crop. Detection is skipped.
+    min_conf: float or None
+        Minimum confidence of detected ears, defaults to `settings.EB_ML_IDENTIFY_MIN_CONF`.
+
+    Returns
+    -------
+    dict
+        `candidates`: `(individual_id, score)` pairs, best first. `ears`: the ears used as `Ear_Bbox` objects, unsaved.
+        `timings`: milliseconds spent per step.
+    """
+    min_conf = settings.EB_ML_IDENTIFY_MIN_CONF if min_conf is None else min_conf
+    timings = {}
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    start = time.perf_counter()
+    if ear is None:
+        bboxes = [bbox for bbox in EarDetector.to_bboxes(EarDetector.infer([image])[0]) if bbox.conf >= min_conf]
+        timings["detection"] = 1000 * (time.perf_counter() - start)
+    else:
+        ear_classes = {name: bbox_cls for bbox_cls, name in Ear_Bbox.cls_map.items()}
+        bboxes = [Ear_Bbox(cls=ear_classes[ear], conf=1.0, x1=0.0, y1=0.0, x2=1.0, y2=1.0)]
+
+    start = time.perf_counter()
+    transform = RightEarFeatureExtractor.get_transform()
+    crops, emb_classes = [], []
+    for feature_extractor in FEATURE_EXTRACTORS:
+        for bbox in bboxes:
+            if feature_extractor.is_valid_bbox(bbox):
+                crops.append(transform(feature_extractor.crop(image, bbox)))
+                emb_classes.append(feature_extractor.embedding_class)
+
+    queries = {}
+    if crops:
+        # Both ears share one model, so every crop goes through a single forward pass
+        embeddings = RightEarFeatureExtractor.embed(crops)
+        emb_classes = np.array(emb_classes)
+        queries = {emb_cls: embeddings[emb_classes == emb_cls].mean(axis=0) for emb_cls in np.unique(emb_classes)}
+    timings["embedding"] = 1000 * (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    candidates = rank_individuals({int(emb_cls): query for emb_cls, query in queries.items()}, k)
+    timings["ranking"] = 1000 * (time.perf_counter() - start)
+
+    logger.info("Identified %d ears in %s", len(crops), ", ".join(f"{step} {ms:.1f}ms" for step, ms in timings.items()))
+    return {"candidates": candidates, "ears": bboxes, "timings": timings}
@@ -0,0 +1,309 @@
+"""In-memory index of individual ear embeddings for fast identity candidate retrieval.
+
+Each `EmbeddingIndex` holds the `Embedding_Centroid` means of one ear class as a contiguous float32 matrix. It catches
+up with the database by fetching only the centroids updated since its last sync, and can be snapshotted to disk so
+other processes memory-map the same matrix instead of building their own.
+
+Celery workers refresh the indexes and write the snapshots, from `eb_ml.tasks.refresh_embedding_indexes` on a beat
+schedule. Web requests only map the latest snapshot, so they never query the database or write to disk for it.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_datetime
+
+from . import centroids
+from .models import Embedding, Embedding_Centroid
+
+logger = logging.getLogger(__name__)
+
+# Centroid rows committed out of timestamp order are still picked up if they land within this margin
+SYNC_MARGIN = timedelta(minutes=1)
+
+
+class EmbeddingIndex:
+    """Exact top-K retrieval over the centroid embeddings of every individual for one ear class."""
+
+    def __init__(self, emb_cls, snapshot_dir=None):
+        self.emb_cls = emb_cls
+        self.snapshot_dir = settings.EB_ML_INDEX_DIR if snapshot_dir is None else snapshot_dir
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.version = 0
+        self.synced = None  # `Embedding_Centroid.updated` high-water mark
+        self.count = 0
+
+        self._positions = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def snapshot(self):
+        """Copies of `ids` and `matrix` taken together, unaffected by later updates of the index."""
+        with self._lock:
+            return self.ids.copy(), np.array(self.matrix, dtype=np.float32)
+
+    def _set(self, ids, matrix):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = matrix
+        self._positions = {individual_id: i for i, individual_id in enumerate(self.ids.tolist())}
+        self.version += 1
+
+    def _centroids(self):
+        return Embedding_Centroid.objects.filter(cls=self.emb_cls, count__gt=0)
+
+    def rebuild(self):
+        """Reload every centroid from the database."""
+        start = time.perf_counter()
+        with self._lock:
+            state = self._centroids().aggregate(count=Count("pk"), synced=Max("updated"))
+            rows = list(self._centroids().values_list("individual_id", "sum", "count"))
+            if rows:
+                ids, sums, counts = zip(*rows)
+                matrix = (Embedding.stack(sums, dtype="float64") / np.array(counts)[:, None]).astype(np.float32)
+            else:
+                ids, matrix = [], np.empty((0, 0), dtype=np.float32)
+            self._set(ids, matrix)
+            self.count, self.synced = state["count"], state["synced"]
+            self.save()
+        logger.info(
+            "Rebuilt embedding index %d (%d individuals) in %.3fs", self.emb_cls, len(self), time.perf_counter() - start
+        )
+
+    def add(self, individual_ids, vectors):
+        """Insert or replace the vectors of `individual_ids`."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(individual_ids), -1)
+        with self._lock:
+            matrix = self.matrix if self.matrix.size else np.empty((0, vectors.shape[1]), dtype=np.float32)
+            if not matrix.flags.writeable:  # Memory-mapped snapshot
+                matrix = matrix.copy()
+
+            new_ids, new_vectors = [], []
+            for individual_id, vector in zip(individual_ids, vectors):
+                position = self._positions.get(individual_id)
+                if position is None:
+                    new_ids.append(individual_id)
+                    new_vectors.append(vector)
+                else:
+                    matrix[position] = vector
+
+            if new_ids:
+                self._set(np.concatenate([self.ids, new_ids]), np.vstack([matrix, new_vectors]))
+            else:
+                self.matrix = matrix
+                self.version += 1
+
+    def remove(self, individual_ids):
+        """Drop `individual_ids` from the index."""
+        with self._lock:
+            keep = ~np.isin(self.ids, list(individual_ids))
+            if not keep.all():
+                self._set(self.ids[keep], self.matrix[keep])
+
+    def refresh(self):
+        """Catch up with the database, fetching only centroids updated since the last sync."""
+        with self._lock:
+            state = self._centroids().aggregate(count=Count("pk"), synced=Max("updated"))
+            if (state["count"], state["synced"]) == (self.count, self.synced):
+                return
+
+            # Another process may already have written a snapshot of this exact state
+            if self.load(state):
+                return
+            if self.synced is None:
+                self.rebuild()
+                return
+
+            rows = list(
+                self._centroids()
+                .filter(updated__gte=self.synced - SYNC_MARGIN)
+                .values_list("individual_id", "sum", "count")
+            )
+            if rows:
+                ids, sums, counts = zip(*rows)
+                self.add(ids, Embedding.stack(sums, dtype="float64") / np.array(counts)[:, None])
+
+            if len(self) != state["count"]:
+                self.remove(set(self.ids.tolist()) - set(self._centroids().values_list("individual_id", flat=True)))
+
+            self.count, self.synced = state["count"], state["synced"]
+            self.save()
+
+    def scores(self, query):
+        """Score `query` against every indexed individual on the same scale as `get_emb_scores`."""
+        if not len(self):
+            return np.empty(0, dtype=np.float32)
+        return 0.5 + self.matrix @ np.asarray(query, dtype=np.float32) / 2
+
+    def search(self, query, k=10):
+        """Exact top-`k` individuals for the mean embedding `query`.
+
+        Returns
+        -------
+        list
+            `(individual_id, score)` pairs, best first.
+        """
+        ids, scores = self.ids, self.scores(query)
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores)
+        return list(zip(ids[order].tolist(), scores[order].tolist()))
+
+    def _snapshot_paths(self):
+        prefix = os.path.join(self.snapshot_dir, f"embedding_index_{self.emb_cls}")
+        return f"{prefix}.npy", f"{prefix}_ids.npy", f"{prefix}.json"
+
+    def save(self):
+        """Atomically replace the on-disk snapshot. Processes that mapped the previous one keep a valid view."""
+        if not self.snapshot_dir or not len(self):
+            return
+        matrix_path, ids_path, meta_path = self._snapshot_paths()
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            for path, data in [(matrix_path, np.ascontiguousarray(self.matrix)), (ids_path, self.ids)]:
+                with open(f"{path}.tmp", "wb") as f:
+                    np.save(f, data)
+                os.replace(f"{path}.tmp", path)
+            with open(f"{meta_path}.tmp", "w") as f:
+                json.dump({"count": self.count, "synced": self.synced.isoformat(), "version": self.version}, f)
+            os.replace(f"{meta_path}.tmp", meta_path)
+        except OSError as e:
+            logger.debug("Could not save embedding index snapshot: %s", e)
+
+    def _snapshot_state(self):
+        """`count` and `synced` of the on-disk snapshot, or `None` if there is none."""
+        if not self.snapshot_dir:
+            return None
+        try:
+            with open(self._snapshot_paths()[2]) as f:
+                meta = json.load(f)
+            return {"count": meta["count"], "synced": parse_datetime(meta["synced"])}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def load(self, state):
+        """Memory-map the on-disk snapshot if it matches the database `state`. Returns whether it was loaded."""
+        if self._snapshot_state() != state:
+            return False
+        matrix_path, ids_path, _ = self._snapshot_paths()
+        try:
+            matrix = np.load(matrix_path, mmap_mode="r")
+            ids = np.load(ids_path)
+        except (OSError, ValueError):
+            return False
+
+        if len(ids) != len(matrix):  # Snapshot replaced between reads
+            return False
+        self._set(ids, matrix)
+        self.count, self.synced = state["count"], state["synced"]
+        return True
+
+    def reload(self):
+        """Map the on-disk snapshot if it is not the one loaded, without querying the database."""
+        with self._lock:
+            state = self._snapshot_state()
+            if state is not None and (state["count"], state["synced"]) != (self.count, self.synced):
+                self.load(state)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(emb_cls, refresh=True):
+    """Process-wide `EmbeddingIndex` for `emb_cls`.
+
+    Refreshed against the database and snapshotted to disk if `refresh`, otherwise only reloaded from the latest
+    snapshot, as in web requests.
+    """
+    with _indexes_lock:
+        index = _indexes.get(emb_cls)
+        if index is None:
+            index = _indexes[emb_cls] = EmbeddingIndex(emb_cls)
+    if refresh:
+        index.refresh()
+    else:
+        index.reload()
+    return index
+
+
+def suggest_individuals(individual_sighting, k=10, weights=None):
+    """Top-`k` candidate individuals for `individual_sighting` based on its ear embeddings.
+
+    Parameters
+    ----------
+    individual_sighting: eb_core.models.Individual_Sighting
+        Sighting to find candidates for.
+    k: int
+        Number of candidates to return.
+    weights: dict or None
+        Weight per embedding class, defaults to equal weights. Classes the sighting has no embeddings for are skipped.
+
+    Returns
+    -------
+    list
+        `(individual_id, score)` pairs, best first.
+    """
+    weights = weights or {emb_cls: 1 for emb_cls in Embedding.cls_map}
+
+    sums = centroids.sum_embeddings(
+        (None, emb_cls, vector)
+        for emb_cls, vector in Embedding.objects.filter(
+            cls__in=weights.keys(),
+            vector__isnull=False,
+            bbox_ml__bounding_box__sighting_bounding_box__individual_sighting=individual_sighting,
+        ).values_list("cls", "vector")
+    )
+
+    return rank_individuals(
+        {emb_cls: embedding_sum / count for (_, emb_cls), (embedding_sum, count) in sums.items()}, k, weights
+    )
+
+
+def rank_individuals(queries, k=10, weights=None):
+    """Top-`k` individuals for query embeddings, combining the scores of each embedding class.
+
+    Parameters
+    ----------
+    queries: dict
+        Query embedding per embedding class, e.g. the mean embedding of a sighting's right ears.
+    k: int
+        Number of candidates to return.
+    weights: dict or None
+        Weight per embedding class, defaults to equal weights.
+
+    Indexes are read from their latest snapshots, see `refresh_embedding_indexes`.
+
+    Returns
+    -------
+    list
+        `(individual_id, score)` pairs, best first.
+    """
+    weights = weights or {emb_cls: 1 for emb_cls in Embedding.cls_map}
+
+    total, total_weight = {}, {}
+    for emb_cls, query in queries.items():
+        index = get_index(emb_cls, refresh=False)
+        for individual_id, score in zip(index.ids.tolist(), index.scores(query).tolist()):
+            total[individual_id] = total.get(individual_id, 0) + weights[emb_cls] * score
+            total_weight[individual_id] = total_weight.get(individual_id, 0) + weights[emb_cls]
+
+    if not total:
+        return []
+    ids = np.fromiter(total.keys(), dtype=np.int64, count=len(total))
+    scores = np.fromiter((total[i] / total_weight[i] for i in total), dtype=np.float64, count=len(total))
+    if k < len(scores):
+        top = np.argpartition(-scores, k)[:k]
+        ids, scores = ids[top], scores[top]
+    order = np.argsort(-scores)
+    return list(zip(ids[order].tolist(), scores[order].tolist()))
@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from eb_ml import artifacts
+from eb_ml.registry import file_checksum
+from eb_ml.tasks import ARTIFACT_HOLDERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Serialize every model to TorchScript under `EB_ML_ARTIFACT_DIR` with a checksummed manifest, "
+        "so workers load them without `torch.hub` or network access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="*", help="Model names to build, defaults to every model")
+
+    def handle(self, *args, **options):
+        os.makedirs(settings.EB_ML_ARTIFACT_DIR, exist_ok=True)
+        manifest = artifacts.read_manifest()
+
+        for model_holder in ARTIFACT_HOLDERS:
+            name = model_holder.model_name
+            if options["models"] and name not in options["models"]:
+                continue
+
+            file_name = f"{name}.pt"
+            path = os.path.join(settings.EB_ML_ARTIFACT_DIR, file_name)
+            tmp_path = f"{path}.tmp"
+
+            start = time.perf_counter()
+            entry = model_holder.build_artifact(tmp_path)
+            build_time = time.perf_counter() - start
+            os.replace(tmp_path, path)
+
+            manifest[name] = entry | {
+                "file": file_name,
+                "sha256": file_checksum(path),
+                "source": os.path.basename(model_holder.weights) if model_holder.weights else "torch.hub",
+            }
+            artifacts.write_manifest(manifest)
+
+            # Cold start from the artifact, as a worker would see it
+            start = time.perf_counter()
+            artifacts.load(path, manifest[name])
+            load_time = time.perf_counter() - start
+
+            self.stdout.write(
+                f"{name}: built in {build_time:.2f}s (including loading the source model), "
+                f"loads in {load_time:.2f}s, {os.path.getsize(path) / 1024**2:.1f}MB, "
+                f"sha256 {manifest[name]['sha256'][:12]}"
+            )
@@ -0,0 +1,106 @@
+import os
+import time
+
+import numpy as np
+import torch
+import torchvision
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from eb_core.models import Photo
+from eb_ml import artifacts
+from eb_ml.tasks import CocoDetector, EarDetector
+from eb_ml.utils import ImageCache, batched
+
+DETECTORS = {detector.model_name: detector for detector in [CocoDetector, EarDetector]}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the detections of a TorchScript detector artifact with the `torch.hub` model on a fixture set of "
+        "photos. Artifacts letterbox every photo to a fixed square while `torch.hub` pads to the batch's aspect ratio, "
+        "so boxes and confidences can differ slightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="*", help="Detector model names, defaults to every detector")
+        parser.add_argument("--fixtures", help="Directory of photos, defaults to the latest photos in the database")
+        parser.add_argument("--count", type=int, default=32, help="Number of photos sampled from the database")
+        parser.add_argument("--batch-size", type=int, default=8)
+        parser.add_argument("--min-iou", type=float, default=0.9, help="Detections overlapping less are unmatched")
+        parser.add_argument("--min-recall", type=float, default=0.95, help="Fail below this share of matched boxes")
+
+    def load_images(self, options):
+        if options["fixtures"]:
+            return [
+                Image.open(os.path.join(options["fixtures"], name)).convert("RGB")
+                for name in sorted(os.listdir(options["fixtures"]))
+            ]
+
+        image_cache = ImageCache()
+        return [image_cache.get(photo) for photo in Photo.objects.non_polymorphic().order_by("-pk")[: options["count"]]]
+
+    def detect(self, model, images, batch_size):
+        detections = []
+        for batch in batched(images, batch_size):
+            detections.extend(xywhn.cpu() for xywhn in model(batch).xywhn)
+        return detections
+
+    def match(self, reference, candidate, min_iou):
+        """IoU and confidence difference of each `reference` detection matched to a `candidate` of the same class."""
+        if not len(reference) or not len(candidate):
+            return np.empty(0), np.empty(0)
+        iou = torchvision.ops.box_iou(
+            torchvision.ops.box_convert(reference[:, :4], "cxcywh", "xyxy"),
+            torchvision.ops.box_convert(candidate[:, :4], "cxcywh", "xyxy"),
+        )
+        iou[reference[:, None, 5] != candidate[None, :, 5]] = 0
+        best_iou, best = iou.max(dim=1)
+        matched = best_iou >= min_iou
+        return best_iou[matched].numpy(), (reference[matched, 4] - candidate[best[matched], 4]).abs().numpy()
+
+    def handle(self, *args, **options):
+        images = self.load_images(options)
+        if not images:
+            raise CommandError("No photos to compare")
+
+        failed = []
+        for name, detector in DETECTORS.items():
+            if options["models"] and name not in options["models"]:
+                continue
+            artifact = artifacts.find(name)
+            if artifact is None:
+                self.stdout.write(f"{name}: no artifact, run `manage.py build_model_artifacts {name}`")
+                continue
+
+            models = {"torch.hub": detector._load_model(detector.weights), "artifact": artifacts.load(*artifact)}
+            detections, times = {}, {}
+            with torch.inference_mode():
+                for model_name, model in models.items():
+                    start = time.perf_counter()
+                    detections[model_name] = self.detect(model, images, options["batch_size"])
+                    times[model_name] = time.perf_counter() - start
+
+            ious, conf_diffs, counts = [], [], {model_name: 0 for model_name in models}
+            for reference, candidate in zip(detections["torch.hub"], detections["artifact"]):
+                iou, conf_diff = self.match(reference, candidate, options["min_iou"])
+                ious.append(iou)
+                conf_diffs.append(conf_diff)
+                counts["torch.hub"] += len(reference)
+                counts["artifact"] += len(candidate)
+            ious, conf_diffs = np.concatenate(ious), np.concatenate(conf_diffs)
+
+            recall = len(ious) / counts["torch.hub"] if counts["torch.hub"] else 1.0
+            precision = len(ious) / counts["artifact"] if counts["artifact"] else 1.0
+            self.stdout.write(
+                f"{name}: {counts['torch.hub']} torch.hub and {counts['artifact']} artifact detections on "
+                f"{len(images)} photos. Matched {recall:.3f} of torch.hub's and {precision:.3f} of the artifact's, "
+                f"mean IoU {ious.mean() if len(ious) else float('nan'):.4f}, "
+                f"max confidence difference {conf_diffs.max() if len(conf_diffs) else 0:.4f}. "
+                f"{times['torch.hub']:.2f}s with torch.hub, {times['artifact']:.2f}s with the artifact"
+            )
+            if min(recall, precision) < options["min_recall"]:
+                failed.append(name)
+
+        if failed:
+            raise CommandError(f"Artifact detections diverge from torch.hub for {', '.join(failed)}")
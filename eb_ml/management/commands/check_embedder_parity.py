@@ -0,0 +1,87 @@
+import os
+import time
+
+import numpy as np
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from eb_ml.models import Ear_Bbox
+from eb_ml.tasks import OptimizedEarEmbedder, RightEarFeatureExtractor
+from eb_ml.utils import ImageCache, batched
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare embeddings of the optimized ear embedder with the fp32 model on a fixture set of ear crops "
+        "and report the CPU throughput of both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fixtures", help="Directory of ear crop images, defaults to detected ears from the database"
+        )
+        parser.add_argument("--count", type=int, default=64, help="Number of ears sampled from the database")
+        parser.add_argument("--batch-size", type=int, default=settings.EB_ML_EXTRACT_BATCH_SIZE)
+        parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the fixtures per model")
+        parser.add_argument("--min-cosine", type=float, default=0.99, help="Fail below this cosine similarity")
+
+    def load_crops(self, options):
+        if options["fixtures"]:
+            return [
+                Image.open(os.path.join(options["fixtures"], name)).convert("RGB")
+                for name in sorted(os.listdir(options["fixtures"]))
+            ]
+
+        image_cache = ImageCache()
+        ears = Ear_Bbox.objects.filter(cls__in=Ear_Bbox.cls_map.keys()).prefetch_related("photo_ml__photo")
+        return [
+            RightEarFeatureExtractor.crop(image_cache.get(ear.photo_ml.photo), ear)
+            for ear in ears.order_by("-pk")[: options["count"]]
+        ]
+
+    def embed(self, model, crops, batch_size, channels_last):
+        features = []
+        with torch.inference_mode():
+            for batch in batched(crops, batch_size):
+                batch = torch.stack(batch)
+                if channels_last:
+                    batch = batch.contiguous(memory_format=torch.channels_last)
+                features.append(model(batch).cpu().numpy())
+        return np.array([RightEarFeatureExtractor._normalize(feature) for feature in np.concatenate(features)])
+
+    def handle(self, *args, **options):
+        transform = RightEarFeatureExtractor.get_transform()
+        crops = [transform(crop) for crop in self.load_crops(options)]
+        if len(crops) < 2:
+            raise CommandError("Need at least two ear crops to compare")
+
+        models = {
+            "fp32": (RightEarFeatureExtractor._load_model(RightEarFeatureExtractor.weights), False),
+            "optimized": (OptimizedEarEmbedder.get_model(), True),
+        }
+        self.stdout.write(
+            f"{len(crops)} ear crops, batch size {options['batch_size']}, {torch.get_num_threads()} threads"
+        )
+
+        embeddings, throughputs = {}, {}
+        for name, (model, channels_last) in models.items():
+            embeddings[name] = self.embed(model, crops, options["batch_size"], channels_last)  # Also warms up
+            start = time.perf_counter()
+            for _ in range(options["repeats"]):
+                self.embed(model, crops, options["batch_size"], channels_last)
+            throughputs[name] = options["repeats"] * len(crops) / (time.perf_counter() - start)
+            self.stdout.write(f"{name}: {throughputs[name]:.1f} crops/s")
+
+        # Embeddings are normalized, so their dot product is the cosine similarity
+        cosine = np.einsum("ij,ij->i", embeddings["fp32"], embeddings["optimized"])
+        neighbours = {name: np.argsort(-(values @ values.T), axis=1)[:, 1] for name, values in embeddings.items()}
+        self.stdout.write(
+            f"Cosine similarity to fp32: min {cosine.min():.5f}, mean {cosine.mean():.5f}. "
+            f"Nearest neighbour agreement: {np.mean(neighbours['fp32'] == neighbours['optimized']):.3f}. "
+            f"Speedup: {throughputs['optimized'] / throughputs['fp32']:.2f}x"
+        )
+
+        if cosine.min() < options["min_cosine"]:
+            raise CommandError(f"Optimized embeddings diverge from fp32 (min cosine {cosine.min():.5f})")
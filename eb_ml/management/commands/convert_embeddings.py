@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from eb_ml.models import Embedding
+
+
+class Command(BaseCommand):
+    help = "Convert `Embedding` rows still stored as JSON float lists to compact float32 blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, chunk_size, **options):
+        converted = 0
+        while True:
+            with transaction.atomic():
+                embeddings = list(
+                    Embedding.objects.filter(vector__isnull=True, data__isnull=False)
+                    .select_for_update()
+                    .only("id", "data")[:chunk_size]
+                )
+                if not embeddings:
+                    break
+
+                for embedding in embeddings:
+                    embedding.array = embedding.data
+                Embedding.objects.bulk_update(embeddings, ["dtype", "dim", "vector", "data"])
+
+            converted += len(embeddings)
+
+        self.stdout.write(f"Converted {converted} embeddings")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from eb_ml import rescoring
+from eb_ml.models import Score, Scoring
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue the rescoring of sightings whose `Scoring` still dates from scores stored as JSON, "
+        "and therefore has no `Score` rows."
+    )
+
+    def handle(self, *args, **options):
+        individual_sighting_ids = list(
+            Scoring.objects.filter(~Exists(Score.objects.filter(individual_sighting=OuterRef("individual_sighting"))))
+            .values_list("individual_sighting", flat=True)
+            .iterator()
+        )
+        if individual_sighting_ids:
+            rescoring.record_changes(individual_sighting_ids=individual_sighting_ids)
+
+        self.stdout.write(f"Queued {len(individual_sighting_ids)} sightings for rescoring")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, F, OuterRef
+
+from eb_ml import centroids
+from eb_ml.models import Embedding, Embedding_Centroid
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the `Embedding_Centroid` rows missing for individuals with embeddings, "
+        "or recompute every centroid from the stored embeddings with --all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Recompute every centroid")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            centroids.rebuild()
+            self.stdout.write(f"Rebuilt {Embedding_Centroid.objects.count()} embedding centroids")
+            return
+
+        individual_ids = set(
+            Embedding.objects.filter(vector__isnull=False)
+            .annotate(individual_id=F(centroids.INDIVIDUAL_LOOKUP))
+            .filter(individual_id__isnull=False)
+            .filter(
+                ~Exists(Embedding_Centroid.objects.filter(individual=OuterRef("individual_id"), cls=OuterRef("cls")))
+            )
+            .values_list("individual_id", flat=True)
+            .distinct()
+        )
+        if individual_ids:
+            centroids.rebuild(individual_ids)
+        self.stdout.write(f"Built the missing embedding centroids of {len(individual_ids)} individuals")
@@ -0,0 +1,73 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+MEMORY_FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+
+def read_memory(pid):
+    """`{field: kB}` of `MEMORY_FIELDS` for process `pid`, from `/proc/<pid>/smaps_rollup`."""
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            field, _, value = line.partition(":")
+            if field in MEMORY_FIELDS:
+                memory[field] = int(value.split()[0])
+    return memory
+
+
+def read_parent(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("PPid:"):
+                return int(line.split()[1])
+    return None
+
+
+def read_command_line(pid):
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the resident and proportional memory of every Celery worker process, to check how much of the "
+        "model weights the prefork pool shares."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pattern", default="celery", help="Substring of the command line of reported processes")
+
+    def handle(self, *args, **options):
+        processes = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit() or int(entry) == os.getpid():
+                continue
+            try:
+                command_line = read_command_line(entry)
+                if options["pattern"] not in command_line:
+                    continue
+                processes[int(entry)] = (read_parent(entry), command_line, read_memory(entry))
+            except (FileNotFoundError, ProcessLookupError, PermissionError):
+                # The process exited, or belongs to another user
+                continue
+        if not processes:
+            raise CommandError(f"No readable process matching {options['pattern']!r}")
+
+        self.stdout.write(f"{'pid':>7} {'ppid':>7} {'rss':>9} {'pss':>9} {'shared':>9} {'private':>9}  command")
+        for pid, (parent, command_line, memory) in sorted(processes.items()):
+            shared = memory["Shared_Clean"] + memory["Shared_Dirty"]
+            private = memory["Private_Clean"] + memory["Private_Dirty"]
+            role = "child" if parent in processes else "parent"
+            self.stdout.write(
+                f"{pid:>7} {parent:>7} {memory['Rss'] / 1024:>7.1f}MB {memory['Pss'] / 1024:>7.1f}MB "
+                f"{shared / 1024:>7.1f}MB {private / 1024:>7.1f}MB  {role}: {command_line[:60]}"
+            )
+
+        rss = sum(memory["Rss"] for _, _, memory in processes.values())
+        pss = sum(memory["Pss"] for _, _, memory in processes.values())
+        # RSS counts shared pages once per process mapping them, PSS splits them between those processes
+        self.stdout.write(
+            f"{len(processes)} processes: {rss / 1024:.1f}MB summed RSS, {pss / 1024:.1f}MB actually used (PSS), "
+            f"{(rss - pss) / 1024:.1f}MB saved by sharing"
+        )
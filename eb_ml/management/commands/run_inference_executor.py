@@ -0,0 +1,52 @@
+import os
+
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from eb_ml.executor import InferenceServer
+from eb_ml.tasks import (
+    MODEL_HOLDERS,
+    CocoDetector,
+    EarDetector,
+    RightEarFeatureExtractor,
+)
+
+
+class Command(BaseCommand):
+    help = "Serve model inference to Celery tasks over a unix socket, batching concurrent requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=settings.EB_ML_INFERENCE_SOCKET)
+        parser.add_argument("--max-batch", type=int, default=settings.EB_ML_INFERENCE_MAX_BATCH)
+        parser.add_argument("--max-latency", type=float, default=settings.EB_ML_INFERENCE_MAX_LATENCY, help="Seconds")
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.EB_ML_TORCH_THREADS or os.cpu_count(),
+            help="Intra-op threads, defaults to every core",
+        )
+
+    def handle(self, *args, **options):
+        if not options["socket"]:
+            raise CommandError("Set EB_ML_INFERENCE_SOCKET or pass --socket")
+
+        torch.set_num_threads(options["threads"])
+        for model_holder in MODEL_HOLDERS:
+            model_holder.get_model()
+
+        server = InferenceServer(
+            options["socket"],
+            {
+                "detect:CocoDetector": CocoDetector._infer,
+                "detect:EarDetector": EarDetector._infer,
+                "embed": lambda crops: list(RightEarFeatureExtractor._embed(crops)),
+            },
+            max_batch=options["max_batch"],
+            max_latency=options["max_latency"],
+        )
+        self.stdout.write(
+            f"Serving inference on {options['socket']} with {options['threads']} threads, "
+            f"batches of up to {options['max_batch']} within {1000 * options['max_latency']:.0f}ms"
+        )
+        server.serve_forever()
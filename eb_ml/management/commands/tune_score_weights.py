@@ -0,0 +1,88 @@
+import itertools
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from eb_core.models import Individual_Sighting
+from eb_ml import tuning
+from eb_ml.tasks import EMB_SCORE_CLASSES, SCORE_WEIGHTS
+
+
+class Command(BaseCommand):
+    help = (
+        "Grid search `SCORE_WEIGHTS` by top-k accuracy over completed sightings, "
+        "reusing cached component score matrices."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cache-dir",
+            default=os.path.join(settings.BASE_DIR, "eb_ml", "data", "tuning"),
+            help="Directory the component score matrices are cached in as `.npy`",
+        )
+        parser.add_argument("--refresh", action="store_true", help="Recompute the cached component score matrices")
+        parser.add_argument(
+            "--values",
+            nargs="+",
+            type=float,
+            default=[0, 0.125, 0.25, 0.5, 1, 2],
+            help="Weights tried for each component",
+        )
+        parser.add_argument("-k", nargs="+", type=int, default=[1, 5, 10], help="Top-k accuracies to report")
+        parser.add_argument("--top", type=int, default=10, help="Number of weightings to report")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        cached = None if options["refresh"] else tuning.load(options["cache_dir"], SCORE_WEIGHTS)
+        if cached is None:
+            cached = tuning.component_matrices(
+                SCORE_WEIGHTS,
+                EMB_SCORE_CLASSES,
+                Individual_Sighting.objects.filter(completed=True, individual__isnull=False),
+            )
+            tuning.save(options["cache_dir"], *cached, SCORE_WEIGHTS)
+            source = "Computed"
+        else:
+            source = "Loaded"
+        components, truth, out_ids, individual_ids = cached
+        self.stdout.write(
+            f"{source} component scores of {len(out_ids)} sightings against {len(individual_ids)} individuals "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        if not len(out_ids):
+            return
+
+        evaluator = tuning.WeightEvaluator(components, truth)
+        ks = sorted(options["k"])
+
+        # Scores are invariant to scaling the weights, so only one weighting per direction is evaluated
+        grid = {}
+        for weights in itertools.product(options["values"], repeat=len(SCORE_WEIGHTS)):
+            if any(weights):
+                grid.setdefault(tuple(np.round(np.array(weights) / max(weights), 6)), weights)
+
+        start = time.perf_counter()
+        results = []
+        eval_times = []
+        for weights in [tuple(SCORE_WEIGHTS.values())] + list(grid.values()):
+            accuracy, eval_time = evaluator.evaluate(weights, ks)
+            results.append((weights, accuracy))
+            eval_times.append(eval_time)
+        self.stdout.write(
+            f"Evaluated {len(results)} weightings in {time.perf_counter() - start:.2f}s "
+            f"({1000 * np.mean(eval_times):.1f}ms each)"
+        )
+
+        def describe(weights, accuracy):
+            return (
+                ", ".join(f"{name}={weight:g}" for name, weight in zip(SCORE_WEIGHTS, weights))
+                + ": "
+                + ", ".join(f"top-{k} {accuracy[k]:.3f}" for k in ks)
+            )
+
+        self.stdout.write(f"Current  {describe(*results[0])}")
+        for weights, accuracy in sorted(results[1:], key=lambda result: [-result[1][k] for k in ks])[: options["top"]]:
+            self.stdout.write(f"         {describe(weights, accuracy)}")
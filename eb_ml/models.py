@@ -1,3 +1,4 @@
+import numpy as np
 from django.db import models
 from polymorphic.models import PolymorphicModel
 
@@ -128,13 +129,137 @@ class Embedding(models.Model):
 
     cls = models.PositiveIntegerField(null=True, blank=True)
 
-    data = models.JSONField()
+    dtype = models.CharField(max_length=16, default="float32")
+    dim = models.PositiveIntegerField(null=True, blank=True)
+    vector = models.BinaryField(null=True, blank=True)
+
+    data = models.JSONField(null=True, blank=True)  # Legacy list of floats, see `manage.py convert_embeddings`
 
     bbox_ml = models.ForeignKey("Bbox_ML", on_delete=models.CASCADE)
 
+    @classmethod
+    def from_array(cls, array, **kwargs):
+        """Construct an unsaved `Embedding` storing `array` as a compact float32 blob."""
+        embedding = cls(**kwargs)
+        embedding.array = array
+        return embedding
+
+    @property
+    def array(self):
+        """Read-only `np.ndarray` view of the stored vector, without copying the underlying bytes."""
+        if self.vector is None:
+            return np.asarray(self.data, dtype=np.float32)
+        return np.frombuffer(self.vector, dtype=self.dtype)
+
+    @array.setter
+    def array(self, array):
+        array = np.ascontiguousarray(array, dtype=np.float32)
+        self.dtype = array.dtype.name
+        self.dim = array.shape[-1]
+        self.vector = array.tobytes()
+        self.data = None
+
+    @staticmethod
+    def stack(vectors, dtype="float32"):
+        """Stack raw `vector` blobs, e.g. from `values_list("vector", flat=True)`, into a 2D array.
+
+        The blobs are joined once and the result is a view over that buffer.
+        """
+        vectors = list(vectors)
+        return np.frombuffer(b"".join(vectors), dtype=dtype).reshape(len(vectors), -1)
+
+
+class Embedding_Centroid(models.Model):
+    """Running sum and count of the embeddings of an `Individual`, per embedding class.
+
+    The mean of pairwise dot products between two sets of embeddings equals the dot product of their means, so the
+    centroid can stand in for all of an individual's embeddings when scoring. Kept current by `eb_ml.centroids`.
+    """
+
+    individual = models.ForeignKey("eb_core.Individual", on_delete=models.CASCADE)
+    cls = models.PositiveIntegerField()
+
+    count = models.PositiveIntegerField(default=0)
+    sum = models.BinaryField()  # float64 to avoid drift from repeated incremental updates
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["individual", "cls"], name="unique_embedding_centroid")]
+
+    @property
+    def sum_array(self):
+        return np.frombuffer(self.sum, dtype=np.float64)
+
+    @property
+    def mean(self):
+        return self.sum_array / self.count
+
 
 class Scoring(models.Model):
+    """Marks an `Individual_Sighting` as scored. The scores themselves are stored as `Score` rows."""
+
     individual_sighting = models.OneToOneField("eb_core.Individual_Sighting", on_delete=models.CASCADE)
     last_updated = models.DateTimeField(auto_now=True)
 
-    data = models.JSONField()
+
+class Score(models.Model):
+    """Score of an `Individual_Sighting` against an `Individual`, with one field per component in `SCORE_WEIGHTS`.
+
+    Pairs without any component score are not stored, so `score` is never null and the index on
+    (`individual_sighting`, `-score`) serves top-K lookups for a sighting directly.
+    """
+
+    individual_sighting = models.ForeignKey("eb_core.Individual_Sighting", on_delete=models.CASCADE)
+    individual = models.ForeignKey("eb_core.Individual", on_delete=models.CASCADE)
+
+    seek_score = models.FloatField(null=True, blank=True)
+    right_ear_emb_score = models.FloatField(null=True, blank=True)
+    left_ear_emb_score = models.FloatField(null=True, blank=True)
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["individual_sighting", "individual"], name="unique_score")]
+        indexes = [models.Index(fields=["individual_sighting", "-score"], name="score_sighting_rank_idx")]
+
+
+class Scoring_Change(models.Model):
+    """A row (`Individual_Sighting`) or column (`Individual`) of the score matrix that needs recomputing.
+
+    Recorded by `eb_ml.rescoring` and consumed by `eb_ml.tasks.update_changed_scorings`. Object ids are stored without a
+    foreign key so changes survive the deletion of the object they refer to.
+    """
+
+    ROW = "row"
+    COLUMN = "column"
+
+    axis = models.CharField(max_length=6, choices=[(ROW, "Individual Sighting"), (COLUMN, "Individual")])
+    object_id = models.PositiveBigIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class Duplicate_Candidate(models.Model):
+    """Pair of individuals that `eb_ml.duplicates.find_duplicates` scored as likely to be the same elephant.
+
+    Component scores are on the `SCORE_WEIGHTS` scale, with `individual` the one with the smaller id. Dismissed pairs
+    are kept so that later runs don't put them up for review again.
+    """
+
+    individual = models.ForeignKey("eb_core.Individual", on_delete=models.CASCADE, related_name="+")
+    other_individual = models.ForeignKey("eb_core.Individual", on_delete=models.CASCADE, related_name="+")
+
+    seek_score = models.FloatField(null=True, blank=True)
+    right_ear_emb_score = models.FloatField(null=True, blank=True)
+    left_ear_emb_score = models.FloatField(null=True, blank=True)
+    score = models.FloatField()
+
+    dismissed = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["individual", "other_individual"], name="unique_duplicate_candidate")
+        ]
+        ordering = ["-score"]
+
+    def __str__(self):
+        return f"{self.individual} / {self.other_individual} ({self.score:.3f})"
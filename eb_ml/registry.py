@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """Compute the SHA-256 checksum of a file.
+
+    Parameters
+    ----------
+    path: str
+        Path of the file to hash.
+    chunk_size: int
+        Number of bytes read at a time.
+
+    Returns
+    -------
+    str
+        Hex digest of the file contents.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models.
+
+    Each model is loaded once per process and kept warm. Entries are keyed by the weights file and its checksum, so
+    replacing a weights file on disk makes the next lookup reload the model without restarting the worker.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._checksums = {}
+        self._lock = threading.RLock()
+        self.load_times = {}
+
+    def checksum(self, path):
+        """Checksum of `path`, only recomputed when the file's size or modification time changes."""
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._checksums.get(path)
+        if cached is None or cached[0] != key:
+            cached = (key, file_checksum(path))
+            self._checksums[path] = cached
+        return cached[1]
+
+    def get(self, name, loader, path=None):
+        """Return the model registered under `name`, loading it with `loader(path)` if missing or stale.
+
+        Parameters
+        ----------
+        name: str
+            Name of the model, shared by every caller using the same weights.
+        loader: callable
+            Called with `path` to construct the model.
+        path: str or None
+            Weights file backing the model. `None` for models without a local weights file.
+
+        Returns
+        -------
+        object
+            The loaded model.
+        """
+        checksum = None if path is None else self.checksum(path)
+
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None and entry[0] == (path, checksum):
+                return entry[1]
+
+            start = time.perf_counter()
+            model = loader(path)
+            self.load_times[name] = time.perf_counter() - start
+            self._models[name] = ((path, checksum), model)
+
+        logger.info(
+            "Loaded model %s from %s (%s) in %.2fs",
+            name,
+            path or "torch.hub",
+            checksum[:12] if checksum else "-",
+            self.load_times[name],
+        )
+        return model
+
+    def evict(self, name):
+        with self._lock:
+            self._models.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self.load_times.clear()
+
+    def __contains__(self, name):
+        return name in self._models
+
+
+registry = ModelRegistry()
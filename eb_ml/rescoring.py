@@ -0,0 +1,72 @@
+"""Change tracking for incremental re-scoring.
+
+A row of the score matrix depends on an `Individual_Sighting`'s SEEK code and embeddings, a column on an `Individual`'s
+latest SEEK code and embedding centroid. Whatever touches either is recorded as a `Scoring_Change` so that
+`eb_ml.tasks.update_changed_scorings` only recomputes those rows and columns.
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from eb_core import catalogue
+from eb_core.models import (
+    Individual,
+    Individual_Sighting,
+    Seek_Identity,
+    Sighting_Bounding_Box,
+)
+
+from .models import Scoring_Change
+
+
+def record_changes(individual_sighting_ids=(), individual_ids=()):
+    """Mark rows (`individual_sighting_ids`) and columns (`individual_ids`) of the score matrix as stale."""
+    catalogue.bump()
+    Scoring_Change.objects.bulk_create(
+        [Scoring_Change(axis=Scoring_Change.ROW, object_id=pk) for pk in set(individual_sighting_ids) if pk is not None]
+        + [Scoring_Change(axis=Scoring_Change.COLUMN, object_id=pk) for pk in set(individual_ids) if pk is not None]
+    )
+
+
+def record_bounding_box_changes(bounding_box_ids):
+    """Mark the rows of the sightings `bounding_box_ids` belong to as stale, e.g. after their embeddings changed."""
+    record_changes(
+        individual_sighting_ids=Sighting_Bounding_Box.objects.non_polymorphic()
+        .filter(pk__in=[pk for pk in bounding_box_ids if pk is not None])
+        .values_list("individual_sighting", flat=True)
+    )
+
+
+@receiver(post_save, sender=Individual_Sighting)
+def individual_sighting_saved(sender, instance, created, **kwargs):
+    individual_sighting_ids, individual_ids = [], []
+    if created or instance.has_changed("seek_identity_id"):
+        individual_sighting_ids.append(instance.pk)
+        individual_ids.append(instance.individual_id)
+    if instance.has_changed("individual_id"):
+        individual_ids += [instance.previous("individual_id"), instance.individual_id]
+    elif instance.has_changed("group_sighting_id"):
+        # The individual's latest code may now be another sighting's
+        individual_ids.append(instance.individual_id)
+
+    if individual_sighting_ids or individual_ids:
+        record_changes(individual_sighting_ids, individual_ids)
+
+
+@receiver(pre_delete, sender=Individual_Sighting)
+def individual_sighting_deleted(sender, instance, **kwargs):
+    record_changes(individual_ids=[instance.individual_id])
+
+
+@receiver(post_save, sender=Seek_Identity)
+def seek_identity_saved(sender, instance, created, **kwargs):
+    if created:  # Not attached to a sighting yet, picked up when the sighting is saved
+        return
+    for individual_sighting_id, individual_id in Individual_Sighting.objects.filter(seek_identity=instance).values_list(
+        "pk", "individual"
+    ):
+        record_changes([individual_sighting_id], [individual_id])
+
+
+@receiver(post_delete, sender=Individual)
+def individual_deleted(sender, instance, **kwargs):
+    record_changes(individual_ids=[instance.pk])
@@ -1,27 +1,59 @@
+import gc
+import logging
+import math
 import os
+import time
+import uuid
+from itertools import chain
 
 import numpy as np
-import pandas as pd
 import torch
 import torchvision
 from celery import shared_task
+from celery.signals import worker_init, worker_process_init
+from django.conf import settings
 from django.contrib.postgres.expressions import ArraySubquery
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import OuterRef
-from PIL import Image, ImageOps
+from django.db.models import OuterRef, Q
+from django.utils import timezone
+from PIL import Image
 from torchvision import transforms
 
+from eb_core import catalogue
 from eb_core.models import (
     Individual,
     Individual_Sighting,
     Photo,
     Sighting_Bounding_Box,
 )
-from eb_core.utils import get_individual_seek_identities, score_seek
+from eb_core.seek import encode, get_seek_matrix, score_codes
+from eb_core.utils import get_individual_seek_identities
 from ElephantBook.settings import BASE_DIR
 
-from .models import Bbox_ML, Coco_Bbox, Ear_Bbox, Embedding, Photo_ML, Scoring
+from . import artifacts, centroids, duplicates, executor, rescoring
+from .index import get_index
+from .models import (
+    Bbox_ML,
+    Coco_Bbox,
+    Ear_Bbox,
+    Embedding,
+    Embedding_Centroid,
+    Photo_ML,
+    Score,
+    Scoring,
+    Scoring_Change,
+)
+from .registry import registry
+from .utils import (
+    ImageCache,
+    Prefetcher,
+    adaptive_batch_size,
+    batched,
+    bulk_create_polymorphic,
+)
+
+logger = logging.getLogger(__name__)
 
 SCORE_WEIGHTS = {
     "seek_score": 1,
@@ -29,20 +61,53 @@ SCORE_WEIGHTS = {
     "left_ear_emb_score": 0.25,
 }
 
+# `Embedding.cls` behind each ear embedding score
+EMB_SCORE_CLASSES = {
+    "right_ear_emb_score": 1,
+    "left_ear_emb_score": 2,
+}
+
+SCORE_CHUNK_SIZE = 100  # Sightings whose `Score` rows are replaced per transaction
+RESCORE_LOCK_KEY = "eb_ml.tasks.rescore_lock"  # Held by the running `update_changed_scorings`
+
+
+class ModelHolder:
+    model_name = None
+    weights = None
 
-class Detector:
+    @classmethod
+    def get_model(cls):
+        """The model from its artifact if there is one (see `eb_ml.artifacts`), otherwise from `_load_model`."""
+        artifact = artifacts.find(cls.model_name)
+        if artifact is not None:
+            path, entry = artifact
+            return registry.get(cls.model_name, lambda path: artifacts.load(path, entry), path)
+        return registry.get(cls.model_name, cls._load_model, cls.weights)
+
+    @classmethod
+    def _load_model(cls, path):
+        return NotImplemented
+
+    @classmethod
+    def build_artifact(cls, path):
+        """Serialize the model loaded by `_load_model` to `path` and return its manifest entry."""
+        return NotImplemented
+
+
+class Detector(ModelHolder):
     @classmethod
     def detect(cls, photo_mls, force=False, **kwargs):
         valid_photo_mls = []
         for photo_ml in photo_mls:
             if photo_ml.detections is None:
-                valid_photo_mls.append(photo_ml)
                 photo_ml.detections = {cls.__name__: None}
-                photo_ml.save()
             elif photo_ml.detections.get(cls.__name__) is None:
-                valid_photo_mls.append(photo_ml)
                 photo_ml.detections.update({cls.__name__: None})
-                photo_ml.save()
+            else:
+                continue
+            valid_photo_mls.append(photo_ml)
+        Photo_ML.objects.bulk_update(valid_photo_mls, ["detections"])
+
         if not force:
             photo_mls = valid_photo_mls
 
@@ -55,98 +120,228 @@ class Detector:
         return NotImplemented
 
 
-class EarDetector(Detector):
+class YOLOv5Detector(Detector):
+    bbox_class = Bbox_ML
+    image_size = 640  # Side of the square images are letterboxed into
+
+    @classmethod
+    def build_artifact(cls, path):
+        return artifacts.trace_yolov5(cls._load_model(cls.weights), path, size=cls.image_size)
+
+    @classmethod
+    def get_batch_size(cls):
+        return adaptive_batch_size(
+            settings.EB_ML_DETECT_BATCH_SIZE, settings.EB_ML_DETECT_BYTES_PER_IMAGE, settings.EB_ML_MEMORY_FRACTION
+        )
+
     @classmethod
-    def _detect(cls, photo_mls):
+    def infer(cls, images):
+        """Normalized `(x, y, w, h, conf, cls)` detections of each of `images`, in input order.
+
+        Runs in the inference executor if one is configured, otherwise in this process.
+        """
+        client = executor.get_client()
+        if client is not None:
+            # Detections are normalized, so the executor gets the images at the size the network sees them
+            return client.run(f"detect:{cls.__name__}", [cls.downscale(image) for image in images])
+        return cls._infer(images)
+
+    @classmethod
+    def downscale(cls, image):
+        """`image` shrunk to fit in `image_size` squared if it is larger, keeping its aspect ratio."""
+        scale = cls.image_size / max(image.size)
+        if scale >= 1:
+            return image
+        return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR)
+
+    @classmethod
+    def _infer(cls, images):
+        # YOLOv5 returns one `xywhn` tensor per input image, in input order
+        return [xywhn.tolist() for xywhn in cls.get_model()(list(images)).xywhn]
+
+    @classmethod
+    def infer_photos(cls, photo_mls, images):
+        """Detections of each of `images`, the decoded photos of `photo_mls`, as returned by `infer`."""
+        return cls.infer(images)
+
+    @classmethod
+    def to_bboxes(cls, detections, **kwargs):
+        """Unsaved `bbox_class` objects for `detections` as returned by `infer`."""
+        return [
+            cls.bbox_class(cls=bbox_cls, conf=conf, x1=x - w / 2, y1=y - h / 2, x2=x + w / 2, y2=y + h / 2, **kwargs)
+            for x, y, w, h, conf, bbox_cls in detections
+        ]
+
+    @classmethod
+    def _detect(cls, photo_mls, image_cache=None):
+        if image_cache is None:
+            image_cache = ImageCache()
+
         bboxes = []
-        model = torch.hub.load(
-            "ultralytics/yolov5", "custom", path=os.path.join(BASE_DIR, "eb_ml/data/ear_YOLOv5_n.pt")
+
+        prefetcher = Prefetcher()
+        images = prefetcher.map(image_cache.get, (photo_ml.photo for photo_ml in photo_mls))
+        for batch in batched(zip(photo_mls, images), cls.get_batch_size()):
+            batch_photo_mls, batch_images = zip(*batch)
+
+            batch_bboxes = []
+            for photo_ml, detections in zip(batch_photo_mls, cls.infer_photos(batch_photo_mls, batch_images)):
+                photo_ml.detections[cls.__name__] = detections
+                batch_bboxes.extend(cls.to_bboxes(detections, photo_ml=photo_ml))
+
+            with transaction.atomic():
+                Photo_ML.objects.bulk_update(batch_photo_mls, ["detections"])
+                Bbox_ML.objects.instance_of(cls.bbox_class).filter(photo_ml__in=batch_photo_mls).delete()
+                bboxes.extend(bulk_create_polymorphic(batch_bboxes))
+
+        logger.info(
+            "%s stalled %.2fs waiting for %d decoded photos", cls.__name__, prefetcher.stall_time, prefetcher.count
         )
-        for photo_ml in photo_mls:
-            photo_ml.detections[cls.__name__] = (
-                model(ImageOps.exif_transpose(Image.open(photo_ml.photo.compressed_image.path))).xywhn[0].tolist()
-            )
-            photo_ml.save()
-
-            photo_ml.bbox_ml_set.instance_of(Ear_Bbox).delete()
-            for x, y, w, h, conf, bbox_cls in photo_ml.detections[cls.__name__]:
-                bbox = Ear_Bbox(
-                    photo_ml=photo_ml,
-                    cls=bbox_cls,
-                    conf=conf,
-                    x1=x - w / 2,
-                    y1=y - h / 2,
-                    x2=x + w / 2,
-                    y2=y + h / 2,
-                )
-                bbox.save()
-                bboxes.append(bbox)
         return bboxes
 
 
-class CocoDetector(Detector):
+class EarDetector(YOLOv5Detector):
+    model_name = "ear_yolov5"
+    weights = os.path.join(BASE_DIR, "eb_ml/data/ear_YOLOv5_n.pt")
+    bbox_class = Ear_Bbox
+
     @classmethod
-    def _detect(cls, photo_mls):
-        bboxes = []
-        model = torch.hub.load("ultralytics/yolov5", "yolov5n")
-        for photo_ml in photo_mls:
-            photo_ml.detections[cls.__name__] = (
-                model(ImageOps.exif_transpose(Image.open(photo_ml.photo.compressed_image.path))).xywhn[0].tolist()
-            )
-            photo_ml.save()
-
-            photo_ml.bbox_ml_set.instance_of(Coco_Bbox).delete()
-            for x, y, w, h, conf, bbox_cls in photo_ml.detections[cls.__name__]:
-                bbox = Coco_Bbox(
-                    photo_ml=photo_ml,
-                    cls=bbox_cls,
-                    conf=conf,
-                    x1=x - w / 2,
-                    y1=y - h / 2,
-                    x2=x + w / 2,
-                    y2=y + h / 2,
+    def _load_model(cls, path):
+        return torch.hub.load("ultralytics/yolov5", "custom", path=path)
+
+    @classmethod
+    def infer_photos(cls, photo_mls, images):
+        """Ear detections of each photo, only searched for around its elephants if `EB_ML_EAR_CASCADE`.
+
+        In cascade mode, photos where `CocoDetector` found no elephant above `EB_ML_EAR_CASCADE_MIN_CONF` get no ears,
+        and therefore no embeddings. The others are searched on a padded crop per elephant, and the ears found are
+        mapped back to the whole photo. Photos `CocoDetector` has not run on are searched whole.
+        """
+        if not settings.EB_ML_EAR_CASCADE:
+            return super().infer_photos(photo_mls, images)
+
+        regions = []
+        for i, (photo_ml, image) in enumerate(zip(photo_mls, images)):
+            coco_detections = (photo_ml.detections or {}).get(CocoDetector.__name__)
+            if coco_detections is None:
+                regions.append((i, (0, 0, image.width, image.height)))
+            else:
+                regions.extend((i, region) for region in cls.elephant_regions(coco_detections, *image.size))
+
+        detections = [[] for _ in photo_mls]
+        for batch in batched(regions, cls.get_batch_size()):
+            crops = [images[i].crop(region) for i, region in batch]
+            for crop_detections, (i, (left, upper, right, lower)) in zip(cls.infer(crops), batch):
+                width, height = images[i].size
+                scale_x, scale_y = (right - left) / width, (lower - upper) / height
+                detections[i].extend(
+                    [
+                        left / width + x * scale_x,
+                        upper / height + y * scale_y,
+                        w * scale_x,
+                        h * scale_y,
+                        conf,
+                        bbox_cls,
+                    ]
+                    for x, y, w, h, conf, bbox_cls in crop_detections
                 )
-                bbox.save()
-                bboxes.append(bbox)
-        return bboxes
+
+        logger.info(
+            "%s cascade: %d of %d photos without elephants, %d regions searched",
+            cls.__name__,
+            len(photo_mls) - len({i for i, _ in regions}),
+            len(photo_mls),
+            len(regions),
+        )
+        return [cls._suppress(photo_detections) for photo_detections in detections]
+
+    @classmethod
+    def elephant_regions(cls, coco_detections, width, height):
+        """Pixel `(left, upper, right, lower)` boxes around the confident elephants of `coco_detections`, padded on
+        each side by `EB_ML_EAR_CASCADE_PADDING` times their size so that ears sticking out are kept.
+        """
+        regions = []
+        for x, y, w, h, conf, bbox_cls in coco_detections:
+            if bbox_cls != 20 or conf < settings.EB_ML_EAR_CASCADE_MIN_CONF:
+                continue
+            half_w = w * (0.5 + settings.EB_ML_EAR_CASCADE_PADDING)
+            half_h = h * (0.5 + settings.EB_ML_EAR_CASCADE_PADDING)
+            left, upper = max(0, math.floor((x - half_w) * width)), max(0, math.floor((y - half_h) * height))
+            right, lower = min(width, math.ceil((x + half_w) * width)), min(height, math.ceil((y + half_h) * height))
+            if right > left and lower > upper:
+                regions.append((left, upper, right, lower))
+        return regions
+
+    @classmethod
+    def _suppress(cls, detections, iou=0.45):
+        """`detections` without the duplicates found in several overlapping elephant crops."""
+        if len(detections) < 2:
+            return detections
+        detections = torch.tensor(detections)
+        boxes = torchvision.ops.box_convert(detections[:, :4], "cxcywh", "xyxy")
+        keep = torchvision.ops.batched_nms(boxes, detections[:, 4], detections[:, 5].long(), iou)
+        return detections[keep].tolist()
+
+
+class CocoDetector(YOLOv5Detector):
+    model_name = "coco_yolov5"
+    bbox_class = Coco_Bbox
+
+    @classmethod
+    def _load_model(cls, path):
+        return torch.hub.load("ultralytics/yolov5", "yolov5n")
 
 
 @shared_task
 def detect(photo_pks, force=False):
-    photos = Photo.objects.filter(pk__in=photo_pks)
+    photos = {photo.pk: photo for photo in Photo.objects.filter(pk__in=photo_pks).non_polymorphic()}
 
-    photo_mls = []
-    for photo in photos:
-        try:
-            photo_ml = photo.photo_ml
-        except ObjectDoesNotExist:
-            photo_ml = Photo_ML()
-            photo_ml.photo = photo
-            photo_ml.save()
-        photo_mls.append(photo_ml)
+    photo_mls = list(Photo_ML.objects.filter(photo__in=photos.keys()))
+    photo_mls += Photo_ML.objects.bulk_create(
+        [Photo_ML(photo_id=pk) for pk in photos.keys() - {photo_ml.photo_id for photo_ml in photo_mls}]
+    )
+    for photo_ml in photo_mls:
+        photo_ml.photo = photos[photo_ml.photo_id]
+
+    # Shared by the detectors and the feature extractors so each photo is only decoded once
+    image_cache = ImageCache()
 
     bboxes = []
     for detector in [CocoDetector, EarDetector]:
-        bboxes.extend(detector.detect(photo_mls, force=force))
+        bboxes.extend(detector.detect(photo_mls, force=force, image_cache=image_cache))
 
     if bboxes:
-        extract_features.delay([bbox.pk for bbox in bboxes], force=force)
+        # In this task rather than queued, so the photos the detectors decoded are reused
+        extract_bbox_features([bbox.pk for bbox in bboxes], force=force, image_cache=image_cache)
+
+    logger.info("Decoded %d photos for %d image requests", image_cache.misses, image_cache.misses + image_cache.hits)
 
-    associate_bboxes.delay(list(photos.values_list("photo_ml", flat=True)))
+    associate_bboxes.delay([photo_ml.pk for photo_ml in photo_mls])
 
 
-class FeatureExtractor:
+class FeatureExtractor(ModelHolder):
     embedding_class = -1
 
     @classmethod
     def extract_features(cls, bbox_mls, force=False, **kwargs):
         bbox_mls = [bbox_ml for bbox_ml in bbox_mls if cls.is_valid_bbox(bbox_ml)]
         if not force:
-            bbox_mls = [bbox_ml for bbox_ml in bbox_mls if not bbox_ml.embedding_set.filter(cls=cls.embedding_class)]
+            embedded = set(
+                Embedding.objects.filter(
+                    cls=cls.embedding_class, bbox_ml__in=[bbox_ml.pk for bbox_ml in bbox_mls]
+                ).values_list("bbox_ml_id", flat=True)
+            )
+            bbox_mls = [bbox_ml for bbox_ml in bbox_mls if bbox_ml.pk not in embedded]
         if bbox_mls:
             return cls._extract_features(bbox_mls, **kwargs)
         return []
 
+    @classmethod
+    def get_batch_size(cls):
+        return adaptive_batch_size(
+            settings.EB_ML_EXTRACT_BATCH_SIZE, settings.EB_ML_EXTRACT_BYTES_PER_CROP, settings.EB_ML_MEMORY_FRACTION
+        )
+
     @classmethod
     def _extract_features(cls, bbox_mls, **kwargs):
         return NotImplemented
@@ -163,23 +358,38 @@ class FeatureExtractor:
 
 class RightEarFeatureExtractor(FeatureExtractor):
     embedding_class = 1
+    model_name = "ear_resnet50"
+    weights = os.path.join(BASE_DIR, "eb_ml/data/ear_piev2_rnet50.pt")
 
     @classmethod
     def is_valid_bbox(cls, bbox_ml):
         return isinstance(bbox_ml, Ear_Bbox) and bbox_ml.cls == 0
 
     @classmethod
-    def _extract_features(cls, bbox_mls, flip=False):
+    def _load_model(cls, path):
         model = torchvision.models.resnet50()
         model.fc = torch.nn.Sequential(
             torch.nn.Linear(model.fc.in_features, 512),
             torch.nn.BatchNorm1d(512),
             torch.nn.ReLU(inplace=True),
         )
-        model.load_state_dict(torch.load(os.path.join(BASE_DIR, "eb_ml/data/ear_piev2_rnet50.pt")))
+        model.load_state_dict(torch.load(path, map_location="cpu"))
         model.eval()
+        return model
+
+    @classmethod
+    def build_artifact(cls, path):
+        return artifacts.trace_module(cls._load_model(cls.weights), path, torch.zeros(1, 3, 256, 256))
 
-        transform = transforms.Compose(
+    @classmethod
+    def get_model(cls):
+        if settings.EB_ML_OPTIMIZED_EMBEDDER:
+            return OptimizedEarEmbedder.get_model()
+        return super().get_model()
+
+    @classmethod
+    def get_transform(cls):
+        return transforms.Compose(
             [
                 transforms.Resize((256, 256)),
                 transforms.ToTensor(),
@@ -187,23 +397,67 @@ class RightEarFeatureExtractor(FeatureExtractor):
             ]
         )
 
-        embeddings = []
-        with torch.no_grad():
-            for bbox_ml in bbox_mls:
-                bbox_ml.embedding_set.filter(cls=cls.embedding_class).delete()
+    @classmethod
+    def crop(cls, im, bbox_ml):
+        """Region of the PIL image `im` inside `bbox_ml`, whose coordinates are normalized."""
+        return im.crop((bbox_ml.x1 * im.width, bbox_ml.y1 * im.height, bbox_ml.x2 * im.width, bbox_ml.y2 * im.height))
 
-                im = ImageOps.exif_transpose(Image.open(bbox_ml.photo_ml.photo.compressed_image.path))
-                im = im.crop(
-                    (bbox_ml.x1 * im.width, bbox_ml.y1 * im.height, bbox_ml.x2 * im.width, bbox_ml.y2 * im.height)
-                )
+    @classmethod
+    def embed(cls, crops):
+        """Normalized embeddings of a batch of transformed crops, one row per crop.
+
+        Runs in the inference executor if one is configured, otherwise in this process.
+        """
+        client = executor.get_client()
+        if client is not None:
+            return np.array(client.run("embed", crops))
+        return cls._embed(crops)
+
+    @classmethod
+    def _embed(cls, crops):
+        batch = torch.stack(list(crops))
+        if settings.EB_ML_OPTIMIZED_EMBEDDER:
+            with torch.inference_mode():
+                features = cls.get_model()(batch.contiguous(memory_format=torch.channels_last)).cpu().numpy()
+        else:
+            with torch.no_grad():
+                features = cls.get_model()(batch).cpu().numpy()
+        return np.array([cls._normalize(feature) for feature in features])
+
+    @classmethod
+    def _extract_features(cls, bbox_mls, flip=False, image_cache=None):
+        if image_cache is None:
+            image_cache = ImageCache()
+
+        transform = cls.get_transform()
+
+        Embedding.objects.filter(cls=cls.embedding_class, bbox_ml__in=[bbox_ml.pk for bbox_ml in bbox_mls]).delete()
+
+        def load_crop(item):
+            photo, bbox_ml = item
+            return transform(cls.crop(image_cache.get(photo), bbox_ml))
 
-                embedding = Embedding.objects.create(
-                    cls=cls.embedding_class,
-                    bbox_ml=bbox_ml,
-                    data=cls._normalize(model(transform(im)[None]).cpu().numpy()[0]).tolist(),
+        prefetcher = Prefetcher()
+        crops = prefetcher.map(load_crop, ((bbox_ml.photo_ml.photo, bbox_ml) for bbox_ml in bbox_mls))
+
+        embeddings = []
+        for batch in batched(zip(bbox_mls, crops), cls.get_batch_size()):
+            batch_bbox_mls, batch_crops = zip(*batch)
+
+            features = cls.embed(batch_crops)
+            # Committed with their centroid deltas so that a concurrent centroid rebuild counts them exactly once
+            with transaction.atomic():
+                batch_embeddings = Embedding.objects.bulk_create(
+                    [
+                        Embedding.from_array(feature, cls=cls.embedding_class, bbox_ml=bbox_ml)
+                        for bbox_ml, feature in zip(batch_bbox_mls, features)
+                    ]
                 )
+                centroids.add_embeddings(batch_embeddings)
+            rescoring.record_bounding_box_changes({bbox_ml.bounding_box_id for bbox_ml in batch_bbox_mls})
+            embeddings.extend(batch_embeddings)
 
-                embeddings.append(embedding)
+        logger.info("%s stalled %.2fs waiting for %d ear crops", cls.__name__, prefetcher.stall_time, prefetcher.count)
         return embeddings
 
 
@@ -215,13 +469,102 @@ class LeftEarFeatureExtractor(RightEarFeatureExtractor):
         return isinstance(bbox_ml, Ear_Bbox) and bbox_ml.cls == 1
 
 
-@shared_task
-def extract_features(bbox_ml_pks, force=False):
-    bbox_mls = Bbox_ML.objects.filter(pk__in=bbox_ml_pks)
+def extract_bbox_features(bbox_ml_pks, force=False, image_cache=None):
+    """Embed the ears among `bbox_ml_pks`, decoding photos through `image_cache` so a caller can share its own."""
+    bbox_mls = Bbox_ML.objects.filter(pk__in=bbox_ml_pks).prefetch_related("photo_ml__photo")
+
+    if image_cache is None:
+        image_cache = ImageCache()
 
     embeddings = []
     for feature_extractor in [RightEarFeatureExtractor, LeftEarFeatureExtractor]:
-        embeddings.extend(feature_extractor.extract_features(bbox_mls, force=force))
+        embeddings.extend(feature_extractor.extract_features(bbox_mls, force=force, image_cache=image_cache))
+    return embeddings
+
+
+@shared_task
+def extract_features(bbox_ml_pks, force=False):
+    extract_bbox_features(bbox_ml_pks, force=force)
+
+
+class OptimizedEarEmbedder(ModelHolder):
+    """CPU-optimized variant of the ear ResNet50, used by the ear feature extractors if `EB_ML_OPTIMIZED_EMBEDDER`.
+
+    The fully connected head is dynamically quantized to int8 and the network runs channels-last. PyTorch only
+    quantizes convolutions statically, which would need calibration data, so they stay fp32. Check the embeddings
+    against the fp32 model with `manage.py check_embedder_parity`.
+    """
+
+    model_name = "ear_resnet50_optimized"
+    weights = RightEarFeatureExtractor.weights
+
+    @classmethod
+    def _load_model(cls, path):
+        model = torch.ao.quantization.quantize_dynamic(
+            RightEarFeatureExtractor._load_model(path), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return model.to(memory_format=torch.channels_last)
+
+    @classmethod
+    def build_artifact(cls, path):
+        return artifacts.trace_module(
+            cls._load_model(cls.weights),
+            path,
+            torch.zeros(1, 3, 256, 256).contiguous(memory_format=torch.channels_last),
+            freeze=True,
+        )
+
+
+MODEL_HOLDERS = [CocoDetector, EarDetector, RightEarFeatureExtractor]
+ARTIFACT_HOLDERS = MODEL_HOLDERS + [OptimizedEarEmbedder]
+
+
+@worker_init.connect
+def preload_models(**kwargs):
+    """Load every model in the worker's parent process, before the pool forks.
+
+    Prefork children inherit the weights copy-on-write and `warm_up_models` finds them in `registry`, so one copy of
+    each model is shared by the whole pool instead of one per child. Nothing is run through the models here, as
+    an OpenMP thread pool started before forking can hang in the children. The garbage collector
+    is frozen afterwards so that collections in the children do not write to, and unshare, the inherited objects.
+    Check the saving with `manage.py report_worker_memory`.
+    """
+    if not settings.EB_ML_PRELOAD_MODELS or not settings.EB_ML_WARM_UP or executor.get_client() is not None:
+        return
+
+    start = time.perf_counter()
+    for model_holder in MODEL_HOLDERS:
+        try:
+            model_holder.get_model()
+        except Exception:
+            logger.exception("Failed to preload %s", model_holder.model_name)
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded models for the worker pool in %.2fs", time.perf_counter() - start)
+
+
+@worker_process_init.connect
+def warm_up_models(**kwargs):
+    """Load every model when a worker process starts so the first task does not pay for model construction."""
+    if settings.EB_ML_TORCH_THREADS:
+        torch.set_num_threads(settings.EB_ML_TORCH_THREADS)
+
+    # Models live in the inference executor if there is one
+    if not settings.EB_ML_WARM_UP or executor.get_client() is not None:
+        return
+
+    start = time.perf_counter()
+    for model_holder in MODEL_HOLDERS:
+        try:
+            model_holder.get_model()
+        except Exception:
+            logger.exception("Failed to warm up %s", model_holder.model_name)
+
+    logger.info(
+        "Warmed up models in %.2fs: %s",
+        time.perf_counter() - start,
+        ", ".join(f"{name} ({load_time:.2f}s)" for name, load_time in registry.load_times.items()),
+    )
 
 
 def bbox_intersection(bbox1, bbox2):
@@ -269,6 +612,7 @@ def associate_bboxes(photo_ml_pks):
                     bbox_ml.bounding_box = None
                 bbox_ml.save()
             elif isinstance(bbox_ml, Ear_Bbox):
+                previous_bounding_box_id = bbox_ml.bounding_box_id
                 for bbox, bbox_dict in zip(bounding_boxes, bounding_box_dicts):
                     if bbox_intersection(bbox_ml_dict, bbox_dict) / bbox_area(bbox_ml_dict) > 0.9:
                         bbox_ml.bounding_box = bbox
@@ -277,6 +621,10 @@ def associate_bboxes(photo_ml_pks):
                     bbox_ml.bounding_box = None
                 bbox_ml.save()
 
+                if bbox_ml.bounding_box_id != previous_bounding_box_id:
+                    centroids.mark_dirty(bounding_box_ids=[previous_bounding_box_id, bbox_ml.bounding_box_id])
+                    rescoring.record_bounding_box_changes([previous_bounding_box_id, bbox_ml.bounding_box_id])
+
 
 def get_emb_scores(
     out_individual_sightings,
@@ -284,6 +632,10 @@ def get_emb_scores(
     database_individuals=Individual.objects,
     database_individual_sightings=Individual_Sighting.objects,
 ):
+    if database_individual_sightings is Individual_Sighting.objects:
+        # Every sighting counts towards the database, so the maintained centroids can stand in for the embeddings
+        return get_centroid_emb_scores(out_individual_sightings, emb_cls, database_individuals)
+
     try:
         out_ids, out_counts, out_embeddings = zip(
             *[
@@ -292,10 +644,11 @@ def get_emb_scores(
                     data_array=ArraySubquery(
                         Embedding.objects.filter(
                             cls=emb_cls,
+                            vector__isnull=False,
                             bbox_ml__bounding_box__in=Sighting_Bounding_Box.objects.filter(
                                 individual_sighting=OuterRef(OuterRef("pk"))
                             ),
-                        ).values("data")
+                        ).values("vector")
                     )
                 ).values_list("id", "data_array")
                 if data
@@ -310,11 +663,12 @@ def get_emb_scores(
                     data_array=ArraySubquery(
                         Embedding.objects.filter(
                             cls=emb_cls,
+                            vector__isnull=False,
                             bbox_ml__bounding_box__in=Sighting_Bounding_Box.objects.filter(
                                 individual_sighting__in=database_individual_sightings.all(),
                                 individual_sighting__individual=OuterRef(OuterRef("pk")),
                             ),
-                        ).values("data")
+                        ).values("vector")
                     )
                 )
                 .values_list("id", "data_array")
@@ -335,7 +689,7 @@ def get_emb_scores(
         0.5
         + np.add.reduceat(
             np.add.reduceat(
-                (np.concatenate(out_embeddings) @ np.concatenate(database_embeddings).T),
+                (Embedding.stack(chain(*out_embeddings)) @ Embedding.stack(chain(*database_embeddings)).T),
                 np.r_[0, np.cumsum(out_counts[:-1])],
             )
             / np.array(out_counts)[:, None],
@@ -349,45 +703,99 @@ def get_emb_scores(
     return scores
 
 
-@shared_task
-def update_scorings(
-    out_individual_sightings,
-    database_individuals=Individual.objects,
-    database_individual_sightings=Individual_Sighting.objects,
-):
-    if not isinstance(out_individual_sightings[0], Individual_Sighting):
-        out_individual_sightings = Individual_Sighting.objects.filter(pk__in=out_individual_sightings)
+def get_centroid_emb_scores(out_individual_sightings, emb_cls, database_individuals=Individual.objects):
+    """Equivalent of `get_emb_scores` over all sightings, using `Embedding_Centroid` for the database side.
 
-    out_individual_sightings = out_individual_sightings.order_by("id")
+    The mean over all pairs of embedding dot products is the dot product of the mean embeddings, so this costs one
+    product per (sighting, individual) pair rather than one per pair of embeddings.
+    """
+    out_ids = list(out_individual_sightings.values_list("id", flat=True))
+    database_ids = list(database_individuals.values_list("id", flat=True))
+
+    scores = np.full((len(out_ids), len(database_ids)), np.nan)
 
-    database_individuals, seek_identities = get_individual_seek_identities(
-        individuals=database_individuals, individual_sightings=database_individual_sightings
+    out_sums = centroids.sum_embeddings(
+        Embedding.objects.filter(
+            cls=emb_cls,
+            vector__isnull=False,
+            bbox_ml__bounding_box__sighting_bounding_box__individual_sighting__in=out_ids,
+        ).values_list("bbox_ml__bounding_box__sighting_bounding_box__individual_sighting", "cls", "vector")
     )
-    seek_strings = [str(seek_identity) for seek_identity in seek_identities]
+    database_centroids = list(
+        Embedding_Centroid.objects.filter(cls=emb_cls, individual__in=database_ids, count__gt=0).values_list(
+            "individual_id", "sum", "count"
+        )
+    )
+    if not out_sums or not database_centroids:
+        return scores
 
-    seek_scores = np.array(
-        [
-            score_seek(out_individual_sighting.seek_identity, seek_identities)
-            for out_individual_sighting in out_individual_sightings
-        ]
+    out_index = {pk: i for i, pk in enumerate(out_ids)}
+    out_means = np.array([total / count for total, count in out_sums.values()])
+
+    database_index = {pk: i for i, pk in enumerate(database_ids)}
+    centroid_ids, centroid_sums, centroid_counts = zip(*database_centroids)
+    database_means = Embedding.stack(centroid_sums, dtype="float64") / np.array(centroid_counts)[:, None]
+
+    rows = [out_index[individual_sighting_id] for individual_sighting_id, _ in out_sums]
+    columns = [database_index[individual_id] for individual_id in centroid_ids]
+    scores[np.ix_(rows, columns)] = 0.5 + out_means @ database_means.T / 2
+
+    return scores
+
+
+def compute_scores(
+    out_individual_sightings,
+    database_individuals=Individual.objects,
+    database_individual_sightings=Individual_Sighting.objects,
+):
+    """Score matrix of `out_individual_sightings` (rows, ordered by pk) against `database_individuals` (columns).
+
+    Returns
+    -------
+    tuple
+        Column `Individual` queryset, component scores of shape `(len(SCORE_WEIGHTS), rows, columns)` aligned with
+        `SCORE_WEIGHTS`, and the weighted total scores.
+    """
+    if database_individual_sightings is Individual_Sighting.objects:
+        database_ids, database_codes = get_seek_matrix().select(
+            None if database_individuals is Individual.objects else database_individuals.values_list("pk", flat=True)
+        )
+        # Drop individuals deleted since the matrix was built
+        existing_ids = list(Individual.objects.filter(pk__in=database_ids).order_by("pk").values_list("pk", flat=True))
+        database_codes = database_codes[np.isin(database_ids, existing_ids)]
+        database_individuals = Individual.objects.filter(pk__in=existing_ids).order_by("pk")
+    else:
+        database_individuals, seek_identities = get_individual_seek_identities(
+            individuals=database_individuals, individual_sightings=database_individual_sightings
+        )
+        database_codes = encode(seek_identities)
+
+    out_seek_identities = [
+        out_individual_sighting.seek_identity
+        for out_individual_sighting in out_individual_sightings.select_related("seek_identity")
+    ]
+    has_seek_identity = np.array([seek_identity is not None for seek_identity in out_seek_identities], dtype=bool)
+
+    # Sightings without a SEEK code are ranked on the other scores alone
+    seek_scores = np.full((len(out_seek_identities), len(database_codes)), np.nan)
+    seek_scores[has_seek_identity] = score_codes(
+        encode([seek_identity for seek_identity in out_seek_identities if seek_identity is not None]), database_codes
     )
 
     right_ear_emb_scores = get_emb_scores(
         out_individual_sightings=out_individual_sightings,
-        emb_cls=1,
+        emb_cls=EMB_SCORE_CLASSES["right_ear_emb_score"],
         database_individuals=database_individuals,
         database_individual_sightings=database_individual_sightings,
     )
 
     left_ear_emb_scores = get_emb_scores(
         out_individual_sightings=out_individual_sightings,
-        emb_cls=2,
+        emb_cls=EMB_SCORE_CLASSES["left_ear_emb_score"],
         database_individuals=database_individuals,
         database_individual_sightings=database_individual_sightings,
     )
 
-    index = pd.Index(database_individuals.values_list("pk", flat=True), name="individual")
-
     scores = np.array(  # Must be aligned with `SCORE_WEIGHTS``
         [
             seek_scores,
@@ -400,26 +808,141 @@ def update_scorings(
         np.ma.MaskedArray(scores, mask=np.isnan(scores)), weights=list(SCORE_WEIGHTS.values()), axis=0
     )
 
-    with transaction.atomic():
-        Scoring.objects.bulk_create(
-            [
-                Scoring(individual_sighting=individual_sighting, data={})
-                for individual_sighting in out_individual_sightings.filter(scoring=None)
-            ]
-        )
+    return database_individuals, scores, total_scores
+
 
-        scorings = Scoring.objects.filter(individual_sighting__in=out_individual_sightings).order_by(
-            "individual_sighting_id"
+def _nan_to_none(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _scores(out_ids, database_ids, scores, total_scores):
+    """`Score` rows for a score matrix, skipping pairs without any component score."""
+    for i, individual_sighting_id in enumerate(out_ids):
+        for j in np.flatnonzero(~np.ma.getmaskarray(total_scores[i])):
+            yield Score(
+                individual_sighting_id=individual_sighting_id,
+                individual_id=database_ids[j],
+                score=float(total_scores[i, j]),
+                **{name: _nan_to_none(value) for name, value in zip(SCORE_WEIGHTS, scores[:, i, j])},
+            )
+
+
+def _write_scores(out_ids, database_ids, scores, total_scores, replace):
+    """Replace the stored `Score` rows of `out_ids`, one transaction per chunk of sightings.
+
+    `replace` filters the rows of a chunk that are deleted before the new ones are inserted.
+    """
+    now = timezone.now()
+    for start in range(0, len(out_ids), SCORE_CHUNK_SIZE):
+        chunk = slice(start, start + SCORE_CHUNK_SIZE)
+        with transaction.atomic():
+            Score.objects.filter(individual_sighting__in=out_ids[chunk], **replace).delete()
+            Score.objects.bulk_create(
+                _scores(out_ids[chunk], database_ids, scores[:, chunk], total_scores[chunk]), batch_size=1000
+            )
+            Scoring.objects.filter(individual_sighting__in=out_ids[chunk]).update(last_updated=now)
+            catalogue.bump()
+
+
+@shared_task
+def update_scorings(
+    out_individual_sightings,
+    database_individuals=Individual.objects,
+    database_individual_sightings=Individual_Sighting.objects,
+):
+    if not isinstance(out_individual_sightings[0], Individual_Sighting):
+        out_individual_sightings = Individual_Sighting.objects.filter(pk__in=out_individual_sightings)
+
+    out_individual_sightings = out_individual_sightings.order_by("id")
+
+    database_individuals, scores, total_scores = compute_scores(
+        out_individual_sightings, database_individuals, database_individual_sightings
+    )
+
+    Scoring.objects.bulk_create(
+        [
+            Scoring(individual_sighting=individual_sighting)
+            for individual_sighting in out_individual_sightings.filter(scoring=None)
+        ]
+    )
+    _write_scores(
+        list(out_individual_sightings.values_list("id", flat=True)),
+        list(database_individuals.values_list("pk", flat=True)),
+        scores,
+        total_scores,
+        replace={},
+    )
+
+
+def update_scoring_columns(individual_ids, scorings=Scoring.objects):
+    """Recompute the columns of `individual_ids` in the already stored `scorings`, leaving other columns untouched.
+
+    Individuals that no longer exist or no longer have a SEEK code are dropped from the scorings.
+    """
+    individual_ids = set(individual_ids)
+    scorings = scorings.filter(individual_sighting__seek_identity__isnull=False)
+    out_individual_sightings = Individual_Sighting.objects.filter(scoring__in=scorings).order_by("id")
+    if not individual_ids or not out_individual_sightings.exists():
+        return
+
+    out_ids = list(out_individual_sightings.values_list("id", flat=True))
+    if len(get_seek_matrix().select(individual_ids)[0]):
+        database_individuals, scores, total_scores = compute_scores(
+            out_individual_sightings, Individual.objects.filter(pk__in=individual_ids)
         )
+        database_ids = list(database_individuals.values_list("pk", flat=True))
+    else:
+        database_ids = []
+        scores = np.empty((len(SCORE_WEIGHTS), len(out_ids), 0))
+        total_scores = np.ma.masked_all((len(out_ids), 0))
+
+    _write_scores(out_ids, database_ids, scores, total_scores, replace={"individual__in": individual_ids})
+
+
+@shared_task
+def update_changed_scorings():
+    """Recompute only the rows and columns of the stored scorings affected by a `Scoring_Change` since the last run.
+
+    A changed `Individual_Sighting` gets its row rescored against every individual, a changed `Individual` gets its
+    column rescored in every other row. Changes are only consumed once processed, so a failed run is retried. A run
+    that overlaps a slower one is skipped, since both would rescore the same changes and race writing them.
+    """
+    token = uuid.uuid4().hex
+    if not cache.add(RESCORE_LOCK_KEY, token, timeout=settings.EB_ML_RESCORE_LOCK_TIMEOUT):
+        logger.info("Skipped rescoring, another run is in progress")
+        return
+    try:
+        _update_changed_scorings()
+    finally:
+        # Don't release a lock that expired and was taken by another run
+        if cache.get(RESCORE_LOCK_KEY) == token:
+            cache.delete(RESCORE_LOCK_KEY)
+
 
-        for i, scoring in enumerate(scorings):
-            df = pd.DataFrame(data=scores[:, i].T, columns=SCORE_WEIGHTS.keys(), index=index)
-            df["score"] = total_scores[i]
-            df["seek_code"] = seek_strings
+def _update_changed_scorings():
+    changes = list(Scoring_Change.objects.values_list("pk", "axis", "object_id"))
+    if not changes:
+        return
 
-            scoring.data = df.sort_values("score", ascending=False).reset_index(level=0).fillna("NaN").to_dict("list")
+    row_ids = {object_id for _, axis, object_id in changes if axis == Scoring_Change.ROW}
+    column_ids = {object_id for _, axis, object_id in changes if axis == Scoring_Change.COLUMN}
 
-        scorings.update()
+    # Sightings that lost their SEEK code can't be scored
+    if Scoring.objects.filter(
+        individual_sighting__in=row_ids, individual_sighting__seek_identity__isnull=True
+    ).delete()[0]:
+        catalogue.bump()
+
+    rows = Individual_Sighting.objects.filter(pk__in=row_ids, seek_identity__isnull=False).filter(
+        Q(scoring__isnull=False) | Q(unidentifiable=False, completed=False)
+    )
+    if rows.exists():
+        update_scorings(rows)
+
+    update_scoring_columns(column_ids, Scoring.objects.exclude(individual_sighting__in=row_ids))
+
+    Scoring_Change.objects.filter(pk__in=[pk for pk, _, _ in changes]).delete()
+    logger.info("Rescored %d rows and %d columns", len(row_ids), len(column_ids))
 
 
 @shared_task
@@ -438,3 +961,24 @@ def fill_sighting_scoring():
 def update_all_sighting_scoring():
     if Individual_Sighting.objects.exists():
         update_scorings(Individual_Sighting.objects.all())
+
+
+@shared_task
+def refresh_embedding_indexes():
+    """Catch the embedding indexes up with the centroids and snapshot them for the web processes to map."""
+    for emb_cls in Embedding.cls_map:
+        get_index(emb_cls)
+
+
+@shared_task
+def find_duplicate_individuals():
+    """Refresh the `Duplicate_Candidate` review list from a blocked comparison of every pair of individuals."""
+    duplicates.save_duplicates(
+        duplicates.find_duplicates(
+            SCORE_WEIGHTS,
+            EMB_SCORE_CLASSES,
+            k=settings.EB_ML_DUPLICATES_PER_INDIVIDUAL,
+            block_size=settings.EB_ML_DUPLICATES_BLOCK_SIZE,
+            min_score=settings.EB_ML_DUPLICATES_MIN_SCORE,
+        )
+    )
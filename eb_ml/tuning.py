@@ -0,0 +1,201 @@
+"""Offline evaluation of `SCORE_WEIGHTS` against sightings with confirmed identities.
+
+Component score matrices are computed once, leave-one-out so that a sighting never counts towards the individual it
+is scored against, and a weighting is then evaluated with two tensor contractions and a rank count. Used by the
+`tune_score_weights` management command.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from eb_core.models import LATEST_SIGHTING_ORDERING, Individual_Sighting
+from eb_core.seek import encode, score_codes
+
+from . import centroids
+from .models import Embedding, Embedding_Centroid
+
+COMPONENTS_FILE = "components.npy"
+TRUTH_FILE = "truth.npy"
+META_FILE = "meta.json"
+
+
+def _latest_codes():
+    """Latest SEEK code of every individual, and which sighting holds it and the code before it."""
+    rows = (
+        Individual_Sighting.objects.filter(individual__isnull=False, seek_identity__isnull=False)
+        .select_related("seek_identity")
+        .order_by("individual", *LATEST_SIGHTING_ORDERING)
+    )
+    latest, previous = {}, {}
+    for individual_sighting in rows.iterator():
+        individual_id = individual_sighting.individual_id
+        if individual_id not in latest:
+            latest[individual_id] = (individual_sighting.pk, individual_sighting.seek_identity)
+        elif individual_id not in previous:
+            previous[individual_id] = individual_sighting.seek_identity
+    return latest, previous
+
+
+def component_matrices(weights, emb_classes, individual_sightings):
+    """Leave-one-out component scores of `individual_sightings` against every individual.
+
+    Parameters
+    ----------
+    weights: dict
+        Score components, as `eb_ml.tasks.SCORE_WEIGHTS`.
+    emb_classes: dict
+        `Embedding.cls` of each ear embedding component, as `eb_ml.tasks.EMB_SCORE_CLASSES`.
+    individual_sightings: QuerySet
+        Sightings with a confirmed `individual`.
+
+    Returns
+    -------
+    tuple
+        Component scores of shape `(len(weights), sightings, individuals)` aligned with `weights`, with NaN where a
+        component is missing, the column of each sighting's individual, and the sighting and individual ids.
+    """
+    latest, previous = _latest_codes()
+    centroid_rows = list(
+        Embedding_Centroid.objects.filter(cls__in=emb_classes.values(), count__gt=0).values_list(
+            "individual_id", "cls", "sum", "count"
+        )
+    )
+    individual_ids = np.unique(np.array(list(latest) + [row[0] for row in centroid_rows], dtype=np.int64))
+    columns = {individual_id: j for j, individual_id in enumerate(individual_ids.tolist())}
+
+    out = [
+        (individual_sighting.pk, individual_sighting.individual_id, individual_sighting.seek_identity)
+        for individual_sighting in individual_sightings.filter(individual__isnull=False)
+        .select_related("seek_identity")
+        .order_by("pk")
+        if individual_sighting.individual_id in columns
+    ]
+    out_ids = np.array([pk for pk, _, _ in out], dtype=np.int64)
+    truth = np.array([columns[individual_id] for _, individual_id, _ in out], dtype=np.int64)
+
+    components = np.full((len(weights), len(out), len(individual_ids)), np.nan, dtype=np.float32)
+    for c, column in enumerate(weights):
+        if column == "seek_score":
+            has_code = np.isin(individual_ids, np.fromiter(latest, dtype=np.int64))
+            has_out_code = np.array([seek_identity is not None for _, _, seek_identity in out], dtype=bool)
+            if has_out_code.any() and has_code.any():
+                database_codes = encode([seek_identity for _, seek_identity in latest.values()])
+                database_codes = database_codes[np.argsort(np.fromiter(latest, dtype=np.int64))]
+                scores = np.full((len(out), len(individual_ids)), np.nan)
+                scores[np.ix_(has_out_code, has_code)] = score_codes(
+                    encode([seek_identity for _, _, seek_identity in out if seek_identity is not None]), database_codes
+                )
+                # A sighting holding its individual's latest code is scored against the code before it instead
+                for i, (pk, individual_id, seek_identity) in enumerate(out):
+                    if seek_identity is not None and latest.get(individual_id, (None,))[0] == pk:
+                        earlier = previous.get(individual_id)
+                        scores[i, truth[i]] = (
+                            np.nan if earlier is None else score_codes(encode([seek_identity]), encode([earlier]))[0, 0]
+                        )
+                components[c] = scores
+            continue
+
+        emb_cls = emb_classes[column]
+        database_rows = [row for row in centroid_rows if row[1] == emb_cls]
+        out_sums = centroids.sum_embeddings(
+            Embedding.objects.filter(
+                cls=emb_cls,
+                vector__isnull=False,
+                bbox_ml__bounding_box__sighting_bounding_box__individual_sighting__in=out_ids.tolist(),
+            ).values_list("bbox_ml__bounding_box__sighting_bounding_box__individual_sighting", "cls", "vector")
+        )
+        if not database_rows or not out_sums:
+            continue
+
+        database_columns = np.array([columns[row[0]] for row in database_rows])
+        database_sums = Embedding.stack([row[2] for row in database_rows], dtype="float64")
+        database_counts = np.array([row[3] for row in database_rows], dtype=np.float64)
+
+        out_positions = {pk: i for i, pk in enumerate(out_ids.tolist())}
+        out_rows = np.array([out_positions[pk] for pk, _ in out_sums])
+        out_embedding_sums = np.array([total for total, _ in out_sums.values()])
+        out_counts = np.array([count for _, count in out_sums.values()], dtype=np.float64)
+        out_means = out_embedding_sums / out_counts[:, None]
+
+        scores = np.full((len(out), len(individual_ids)), np.nan)
+        scores[np.ix_(out_rows, database_columns)] = 0.5 + out_means @ (database_sums / database_counts[:, None]).T / 2
+
+        # Remove each sighting's own embeddings from its individual's centroid
+        database_positions = {j: p for p, j in enumerate(database_columns.tolist())}
+        for i, r in enumerate(out_rows.tolist()):
+            p = database_positions.get(int(truth[r]))
+            if p is None:
+                continue
+            remaining = database_counts[p] - out_counts[i]
+            scores[r, truth[r]] = (
+                np.nan
+                if remaining <= 0
+                else 0.5 + out_means[i] @ ((database_sums[p] - out_embedding_sums[i]) / remaining) / 2
+            )
+        components[c] = scores
+
+    return components, truth, out_ids, individual_ids
+
+
+def save(directory, components, truth, out_ids, individual_ids, weights):
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, COMPONENTS_FILE), components)
+    np.save(os.path.join(directory, TRUTH_FILE), truth)
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(
+            {
+                "components": list(weights),
+                "individual_sightings": out_ids.tolist(),
+                "individuals": individual_ids.tolist(),
+            },
+            f,
+        )
+
+
+def load(directory, weights):
+    """Cached matrices as returned by `component_matrices`, or `None` if missing or built for other components."""
+    try:
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta["components"] != list(weights):
+        return None
+    return (
+        np.load(os.path.join(directory, COMPONENTS_FILE), mmap_mode="r"),
+        np.load(os.path.join(directory, TRUTH_FILE)),
+        np.array(meta["individual_sightings"], dtype=np.int64),
+        np.array(meta["individuals"], dtype=np.int64),
+    )
+
+
+class WeightEvaluator:
+    """Top-k accuracy of weightings over fixed component matrices."""
+
+    def __init__(self, components, truth):
+        present = ~np.isnan(components)
+        self.values = np.where(present, components, 0).astype(np.float32)
+        self.present = present.astype(np.float32)
+        self.truth = truth
+        self.rows = np.arange(len(truth))
+
+    def ranks(self, weights):
+        """0-based rank of the true individual of each sighting under `weights`, one weight per component."""
+        weights = np.asarray(weights, dtype=np.float32)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            total = np.tensordot(weights, self.values, axes=1) / np.tensordot(weights, self.present, axes=1)
+        total = np.where(np.isnan(total), -np.inf, total)
+        true_scores = total[self.rows, self.truth]
+        ranks = (total > true_scores[:, None]).sum(axis=1)
+        # A sighting without any score for its own individual is never a hit
+        ranks[np.isneginf(true_scores)] = total.shape[1]
+        return ranks
+
+    def evaluate(self, weights, ks):
+        """`{k: top-k accuracy}` and the seconds the evaluation took."""
+        start = time.perf_counter()
+        ranks = self.ranks(weights)
+        accuracy = {k: float((ranks < k).mean()) if len(ranks) else float("nan") for k in ks}
+        return accuracy, time.perf_counter() - start
@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router, transaction
+from PIL import Image, ImageOps
+
+
+def batched(iterable, n):
+    """Yield successive lists of at most `n` items from `iterable`."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, n)):
+        yield batch
+
+
+def _concrete_fields(model, include_parents=True):
+    return [field for field in model._meta.get_fields(include_parents=include_parents) if field.concrete]
+
+
+def bulk_create_polymorphic(objs, batch_size=1000):
+    """`bulk_create` for instances of a multi-table `PolymorphicModel` subclass such as `Ear_Bbox`.
+
+    Django refuses to `bulk_create` multi-table inherited models, so the parent rows are created with
+    `QuerySet.bulk_create` and the subclass' content type, and the child rows pointing at them are then inserted with
+    a multi-row `INSERT` per `batch_size` objects. Only documented APIs are used. Requires a database that returns
+    primary keys from bulk inserts (PostgreSQL).
+
+    Parameters
+    ----------
+    objs: list
+        Unsaved instances, all of the same single-level subclass.
+    batch_size: int
+        Child rows inserted per query.
+
+    Returns
+    -------
+    list
+        `objs`, now saved.
+    """
+    if not objs:
+        return objs
+
+    model = type(objs[0])
+    parent_link = model._meta.pk
+    parent_model = parent_link.remote_field.model
+    using = router.db_for_write(model)
+    connection = connections[using]
+    ctype = ContentType.objects.db_manager(using).get_for_model(model, for_concrete_model=False)
+
+    parents = []
+    for obj in objs:
+        parent = parent_model(
+            **{field.attname: getattr(obj, field.attname) for field in _concrete_fields(parent_model)}
+        )
+        parent.polymorphic_ctype_id = ctype.pk
+        parents.append(parent)
+
+    fields = _concrete_fields(model, include_parents=False)
+    quote_name = connection.ops.quote_name
+    sql = "INSERT INTO {} ({}) VALUES ".format(
+        quote_name(model._meta.db_table), ", ".join(quote_name(field.column) for field in fields)
+    )
+    row = "({})".format(", ".join(["%s"] * len(fields)))
+
+    with transaction.atomic(using=using):
+        parent_model._base_manager.using(using).bulk_create(parents, batch_size=batch_size)
+
+        for obj, parent in zip(objs, parents):
+            setattr(obj, parent_model._meta.pk.attname, parent.pk)
+            setattr(obj, parent_link.attname, parent.pk)
+            obj.polymorphic_ctype_id = ctype.pk
+
+        with connection.cursor() as cursor:
+            for batch in batched(objs, batch_size):
+                cursor.execute(
+                    sql + ", ".join([row] * len(batch)),
+                    [
+                        field.get_db_prep_save(getattr(obj, field.attname), connection)
+                        for obj in batch
+                        for field in fields
+                    ],
+                )
+
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = using
+    return objs
+
+
+class Prefetcher:
+    """Thread pool stage that loads upcoming items in the background while the caller runs inference.
+
+    At most `depth` items are loaded ahead of the consumer. `stall_time` accumulates the time the consumer spent
+    waiting for an item that was not ready yet.
+    """
+
+    def __init__(self, workers=None, depth=None):
+        self.workers = settings.EB_ML_LOADER_WORKERS if workers is None else workers
+        self.depth = settings.EB_ML_LOADER_DEPTH if depth is None else depth
+        self.stall_time = 0.0
+        self.count = 0
+
+    def map(self, load, items):
+        """Yield `load(item)` for each of `items`, in order.
+
+        `items` is consumed lazily on the calling thread, so any database access needed to build an item happens there
+        rather than in the loader threads.
+        """
+        iterator = iter(items)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque(executor.submit(load, item) for item in islice(iterator, self.depth))
+            while pending:
+                future = pending.popleft()
+
+                start = time.perf_counter()
+                result = future.result()
+                self.stall_time += time.perf_counter() - start
+                self.count += 1
+
+                pending.extend(executor.submit(load, item) for item in islice(iterator, 1))
+                yield result
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def available_memory():
+    """Bytes of memory available to this process, taking the container's cgroup limit into account if there is one.
+
+    Returns
+    -------
+    int or None
+        Available memory in bytes, or `None` if it cannot be determined.
+    """
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        try:
+            available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError):
+            pass
+
+    # cgroup v2, then v1
+    for limit_path, usage_path in [
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ]:
+        limit, usage = _read_int(limit_path), _read_int(usage_path)
+        if limit is not None and usage is not None:
+            cgroup_available = max(limit - usage, 0)
+            available = cgroup_available if available is None else min(available, cgroup_available)
+            break
+
+    return available
+
+
+def adaptive_batch_size(max_batch_size, bytes_per_item, memory_fraction=0.5):
+    """Largest batch size up to `max_batch_size` whose estimated footprint fits in a fraction of available memory.
+
+    Parameters
+    ----------
+    max_batch_size: int
+        Upper bound on the batch size.
+    bytes_per_item: int
+        Estimated peak memory used per item in a batch.
+    memory_fraction: float
+        Fraction of the available memory a batch may use.
+
+    Returns
+    -------
+    int
+        Batch size, at least 1.
+    """
+    available = available_memory()
+    if available is None:
+        return max_batch_size
+    return max(1, min(max_batch_size, int(available * memory_fraction) // bytes_per_item))
+
+
+class ImageCache:
+    """Bounded LRU cache of decoded, EXIF-transposed `Photo.compressed_image` pixels.
+
+    One cache is shared by every stage of a pipeline run so each photo is decoded once instead of once per detector and
+    once per bounding box. Entries are keyed by photo pk and file modification time, and the least recently used
+    images are evicted once the decoded pixels exceed `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = settings.EB_ML_IMAGE_CACHE_BYTES if max_bytes is None else max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _image_nbytes(image):
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, photo):
+        """Decoded image for `photo`, loaded from disk on a miss.
+
+        The returned image is shared and must not be modified in place.
+        """
+        path = photo.compressed_image.path
+        key = (photo.pk, os.stat(path).st_mtime_ns)
+
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        image = ImageOps.exif_transpose(Image.open(path))
+        image.load()
+
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = image
+                self._nbytes += self._image_nbytes(image)
+                while self._nbytes > self.max_bytes and len(self._images) > 1:
+                    _, evicted = self._images.popitem(last=False)
+                    self._nbytes -= self._image_nbytes(evicted)
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
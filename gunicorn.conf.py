@@ -8,3 +8,13 @@ reload = True
 accesslog = "/ElephantBook/logs/gunicorn.access.log"
 errorlog = "/ElephantBook/logs/gunicorn.error.log"
 loglevel = "warning"
+
+
+def post_worker_init(worker):
+    # Keep the first query-by-image request from paying for model loading
+    from django.conf import settings
+
+    if settings.EB_ML_IDENTIFY_WARM_UP:
+        from eb_ml.identify import warm_up
+
+        warm_up()
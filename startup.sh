@@ -8,6 +8,10 @@ fi
 
 python manage.py makemigrations
 python manage.py migrate
+python manage.py convert_embeddings
+python manage.py convert_scorings
+python manage.py rebuild_embedding_centroids
+python manage.py rebuild_individual_summaries
 python manage.py collectstatic --noinput
 
 exec "$@"